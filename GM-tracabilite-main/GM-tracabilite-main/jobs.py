@@ -0,0 +1,266 @@
+"""Exécution en arrière-plan des enrichissements lancés depuis Streamlit.
+
+Chaque tâche a un identifiant et un dossier `<JOBS_DIR>/<id>/` (fichier de
+scans, fichier de sortie, état de progression). Leur état est gardé dans une
+base SQLite (`<JOBS_DIR>/jobs.db`). Les tâches sont mises en file et au plus `MAX_JOBS`
+processus `tracabilite.py` tournent en même temps.
+
+Les tâches interrompues par un redémarrage de l'application sont remises en
+file et reprennent à leur dernier checkpoint (`tracabilite.py --resume`).
+"""
+
+import os
+import sys
+import uuid
+import shutil
+import time
+import signal
+import sqlite3
+import threading
+import subprocess
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from progress import read_progress
+
+load_dotenv()
+
+JOBS_DIR = os.path.abspath(os.getenv("TRACABILITE_JOBS_DIR", "jobs"))
+MAX_JOBS = int(os.getenv("TRACABILITE_MAX_JOBS", "2"))
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracabilite.py")
+# Attente max (secondes) de l'arrêt d'un processus orphelin avant SIGKILL
+STOP_TIMEOUT = float(os.getenv("TRACABILITE_STOP_TIMEOUT", "60"))
+
+QUEUED = "en attente"
+RUNNING = "en cours"
+COMPLETED = "terminée"
+FAILED = "en erreur"
+CANCELLED = "annulée"
+ACTIVE = (QUEUED, RUNNING)
+
+
+class JobStore:
+    def __init__(self, path: str):
+        self.path = path
+        with self.connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.execute(
+                "create table if not exists jobs ("
+                "id text primary key, status text, created text, started text, "
+                "finished text, input_name text, output text, rows integer, "
+                "pid integer, cancel integer default 0, error text, "
+                "resume integer default 0)"
+            )
+            columns = [row["name"] for row in conn.execute("pragma table_info(jobs)")]
+            if "resume" not in columns:
+                conn.execute("alter table jobs add column resume integer default 0")
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def insert(self, job: dict):
+        with self.connect() as conn:
+            conn.execute(
+                f"insert into jobs ({', '.join(job)}) values ({', '.join('?' * len(job))})",
+                list(job.values()),
+            )
+
+    def update(self, job_id: str, **values):
+        with self.connect() as conn:
+            conn.execute(
+                f"update jobs set {', '.join(f'{k}=?' for k in values)} where id=?",
+                [*values.values(), job_id],
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.connect() as conn:
+            row = conn.execute("select * from jobs where id=?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, statuses=None, limit: int = 50) -> List[dict]:
+        query = "select * from jobs"
+        params = []
+        if statuses is not None:
+            query += f" where status in ({', '.join('?' * len(statuses))})"
+            params = list(statuses)
+        query += " order by rowid desc limit ?"
+        with self.connect() as conn:
+            rows = conn.execute(query, [*params, limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, job_id: str):
+        with self.connect() as conn:
+            conn.execute("delete from jobs where id=?", (job_id,))
+
+
+class JobRunner:
+    """File de tâches et thread de supervision des processus."""
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, max_jobs: int = MAX_JOBS):
+        self.jobs_dir = jobs_dir
+        self.max_jobs = max_jobs
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.store = JobStore(os.path.join(jobs_dir, "jobs.db"))
+        self.processes = {}
+        self.lock = threading.Lock()
+        self.recover()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def submit(self, scans_df: pd.DataFrame, input_name: str = None) -> str:
+        job_id = datetime.now().strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        os.makedirs(self.job_dir(job_id))
+        scans_df.to_csv(os.path.join(self.job_dir(job_id), "scans.csv"), index=False)
+        self.store.insert(
+            {
+                "id": job_id,
+                "status": QUEUED,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "input_name": input_name,
+                "output": f"tracabilite-{job_id}.csv",
+                "rows": scans_df.shape[0],
+            }
+        )
+        return job_id
+
+    def cancel(self, job_id: str):
+        with self.lock:
+            job = self.store.get(job_id)
+            if job is None or job["status"] not in ACTIVE:
+                return
+            if job["status"] == QUEUED:
+                self.store.update(
+                    job_id,
+                    status=CANCELLED,
+                    finished=datetime.now().isoformat(timespec="seconds"),
+                )
+                return
+            # Le processus annule son upload S3 à la réception de SIGTERM
+            self.store.update(job_id, cancel=1)
+            try:
+                os.kill(job["pid"], signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def delete(self, job_id: str):
+        """Supprime une tâche terminée et ses fichiers locaux."""
+        job = self.store.get(job_id)
+        if job is None or job["status"] in ACTIVE:
+            return
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        self.store.delete(job_id)
+
+    def progress(self, job_id: str) -> Optional[dict]:
+        """Dernier état de progression de la tâche (voir `ProgressReporter`)."""
+        return read_progress(os.path.join(self.job_dir(job_id), "progress.json"))
+
+    def start(self, job: dict):
+        env = dict(os.environ)
+        # Le cache est partagé par toutes les tâches malgré le changement de dossier
+        if env.get("TRACABILITE_CACHE"):
+            env["TRACABILITE_CACHE"] = os.path.abspath(env["TRACABILITE_CACHE"])
+        args = [sys.executable, SCRIPT, "-i", "scans.csv", "-o", job["output"], "-p", "progress.json"]
+        if job["resume"]:
+            args.append("--resume")
+        process = subprocess.Popen(
+            args,
+            cwd=self.job_dir(job["id"]),
+            env=env,
+        )
+        self.processes[job["id"]] = process
+        self.store.update(
+            job["id"],
+            status=RUNNING,
+            pid=process.pid,
+            started=datetime.now().isoformat(timespec="seconds"),
+        )
+
+    def finish(self, job_id: str, returncode: int):
+        job = self.store.get(job_id)
+        if job["cancel"]:
+            status, error = CANCELLED, None
+        elif returncode == 0:
+            status, error = COMPLETED, None
+        else:
+            status, error = FAILED, f"Code de sortie {returncode}"
+        self.store.update(
+            job_id,
+            status=status,
+            error=error,
+            finished=datetime.now().isoformat(timespec="seconds"),
+        )
+
+    def is_job_process(self, pid: int, job_id: str) -> bool:
+        """Vérifie que `pid` est encore le `tracabilite.py` de la tâche : après
+        un redémarrage, le PID enregistré peut désigner un autre processus.
+        Sans /proc, la tâche est considérée comme déjà terminée."""
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+            cwd = os.readlink(f"/proc/{pid}/cwd")
+        except OSError:
+            return False
+        same_dir = os.path.realpath(cwd) == os.path.realpath(self.job_dir(job_id))
+        return os.fsencode(SCRIPT) in cmdline and same_dir
+
+    def stop_process(self, pid: int, job_id: str):
+        """Arrête un processus de tâche qui n'est plus suivi, et attend sa fin
+        (il annule son upload S3 et garde son checkpoint)."""
+        if not self.is_job_process(pid, job_id):
+            return
+        try:
+            os.kill(pid, signal.SIGTERM)
+            deadline = time.monotonic() + STOP_TIMEOUT
+            while self.is_job_process(pid, job_id):
+                if time.monotonic() >= deadline:
+                    os.kill(pid, signal.SIGKILL)
+                    break
+                time.sleep(0.2)
+        except ProcessLookupError:
+            pass
+
+    def recover(self):
+        # Tâches en cours lors d'un redémarrage de l'application : leurs
+        # processus ne sont plus suivis. Ils sont arrêtés s'ils tournent
+        # encore, puis les tâches sont relancées depuis leur checkpoint.
+        for job in self.store.list(statuses=(RUNNING,), limit=-1):
+            if job["pid"] is not None:
+                self.stop_process(job["pid"], job["id"])
+            if job["cancel"]:
+                self.store.update(
+                    job["id"],
+                    status=CANCELLED,
+                    finished=datetime.now().isoformat(timespec="seconds"),
+                )
+            else:
+                self.store.update(job["id"], status=QUEUED, pid=None, resume=1)
+
+    def poll(self):
+        with self.lock:
+            for job_id, process in list(self.processes.items()):
+                returncode = process.poll()
+                if returncode is not None:
+                    del self.processes[job_id]
+                    self.finish(job_id, returncode)
+
+            queued = self.store.list(statuses=(QUEUED,), limit=-1)
+            for job in reversed(queued):
+                if len(self.processes) >= self.max_jobs:
+                    break
+                self.start(job)
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Erreur du superviseur de tâches : {e}")
+            time.sleep(1)
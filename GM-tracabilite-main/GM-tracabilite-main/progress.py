@@ -0,0 +1,89 @@
+"""État de progression d'un enrichissement, lu par l'app pendant qu'il tourne.
+
+Module sans dépendance à S3 ni à l'API : `jobs.py` le charge sans créer de
+client boto3.
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Mise à jour de l'état de progression toutes les N secondes ou N points de %
+PROGRESS_SECONDS = float(os.getenv("TRACABILITE_PROGRESS_SECONDS", "1"))
+PROGRESS_PERCENT = int(os.getenv("TRACABILITE_PROGRESS_PERCENT", "1"))
+
+
+class ProgressReporter:
+    """État de progression dans un petit fichier JSON réécrit en place (de
+    façon atomique), au plus toutes les `min_seconds` secondes ou tous les
+    `min_percent` points de pourcentage.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        output_file: str,
+        min_seconds: float = PROGRESS_SECONDS,
+        min_percent: int = PROGRESS_PERCENT,
+    ):
+        self.path = path
+        self.output_file = output_file
+        self.min_seconds = min_seconds
+        self.min_percent = min_percent
+        self.started = None
+        self.start_done = 0
+        self.last_write = None
+        self.last_percent = None
+        self.last_done = 0
+
+    def update(self, done: int, total: int, message: str, status: str = "running"):
+        now = time.monotonic()
+        self.last_done = done
+        if self.started is None:
+            # Le débit est calculé sur cette exécution (sans les scans repris)
+            self.started = now
+            self.start_done = done
+        percent = int(done / total * 100) if total > 0 else 100
+        if (
+            status == "running"
+            and self.last_write is not None
+            and now - self.last_write < self.min_seconds
+            and percent - self.last_percent < self.min_percent
+        ):
+            return
+
+        elapsed = now - self.started
+        rows_per_sec = (done - self.start_done) / elapsed if elapsed > 0 else None
+        eta = (total - done) / rows_per_sec if rows_per_sec else None
+        state = {
+            "pid": os.getpid(),
+            "status": status,
+            "percent": percent,
+            "done": done,
+            "total": total,
+            "rows_per_sec": rows_per_sec,
+            "eta_seconds": eta,
+            "message": message,
+            "output": self.output_file,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.path}.tmp", self.path)
+        self.last_write = now
+        self.last_percent = percent
+        print(f"{percent}%:\t{message}")
+
+
+def read_progress(path: str) -> dict:
+    """Dernier état écrit par `ProgressReporter`, ou None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,98 @@
+"""S3 simulé par moto et API locale, pour lancer `tracabilite.py` en entier."""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pandas as pd
+import pytest
+from moto.server import ThreadedMotoServer
+
+from tracabilite import S3_BUCKET
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tracabilite.py")
+
+
+def open_uploads(client) -> list:
+    return client.list_multipart_uploads(Bucket=S3_BUCKET).get("Uploads", [])
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_scans(path, count: int = 600) -> list:
+    codes = [str(1000000000 + i) for i in range(count)]
+    pd.DataFrame({"id": range(count), "ID 10 N": codes}).to_csv(path, index=False)
+    return codes
+
+
+# L'API rend assez d'envois par unité pour dépasser vite la taille d'une part
+ENVOIS_PAR_UNITE = 100
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        code = self.path.rsplit("/", 1)[-1]
+        time.sleep(0.005)
+        body = json.dumps(
+            [
+                {
+                    "type": "envoi_amiens",
+                    "code_parallele": f"PA{i:010d}",
+                    "emballage": "PA",
+                    "date": "2024-05-29T08:33:51",
+                    "localisation": {
+                        "adresse": f"{code} " + "x" * 200,
+                        "code_postal": "80000",
+                        "ville": "AMIENS",
+                        "code_pays": "FR",
+                        "pays": "FRANCE",
+                    },
+                }
+                for i in range(ENVOIS_PAR_UNITE)
+            ]
+        ).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def services(monkeypatch):
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    api = ThreadingHTTPServer(("127.0.0.1", 0), ApiHandler)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    env = {
+        **os.environ,
+        "AWS_ACCESS_KEY_ID": "test",
+        "AWS_SECRET_ACCESS_KEY": "test",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ENDPOINT_URL": f"http://127.0.0.1:{server.get_host_and_port()[1]}",
+        "API_CLARINS_LOT2_ENDPOINT": f"http://127.0.0.1:{api.server_address[1]}",
+        "TRACABILITE_CHECKPOINT_SECONDS": "0.2",
+    }
+    client = boto3.client(
+        "s3",
+        endpoint_url=env["AWS_ENDPOINT_URL"],
+        region_name="us-east-1",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+    )
+    client.create_bucket(Bucket=S3_BUCKET)
+    yield env, client
+    api.shutdown()
+    server.stop()
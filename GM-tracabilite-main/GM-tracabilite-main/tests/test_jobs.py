@@ -0,0 +1,60 @@
+"""File de tâches : reprise des tâches interrompues par un redémarrage."""
+
+import csv
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from conftest import ENVOIS_PAR_UNITE, read_json, write_scans
+from jobs import CANCELLED, COMPLETED, QUEUED, RUNNING, JobRunner
+
+
+def test_import_sans_boto3():
+    code = "import sys, jobs; assert 'tracabilite' not in sys.modules and 'boto3' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def wait_for(condition, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_reprise_apres_redemarrage(services, tmp_path, monkeypatch):
+    env, client = services
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    write_scans(tmp_path / "scans.csv")
+    scans_df = pd.read_csv(tmp_path / "scans.csv", dtype=str)
+    jobs_dir = str(tmp_path / "jobs")
+
+    runner = JobRunner(jobs_dir, max_jobs=1)
+    job_id = runner.submit(scans_df, "scans.csv")
+    annulee = runner.submit(scans_df.head(10), "annulee.csv")
+    wait_for(lambda: runner.store.get(job_id)["status"] == RUNNING)
+    job = runner.store.get(job_id)
+    checkpoint = f"{runner.job_dir(job_id)}/{job['output']}.checkpoint.json"
+    wait_for(lambda: (read_json(checkpoint) or {}).get("scans_done"))
+
+    # Redémarrage : l'ancien superviseur ne suit plus ses processus
+    runner.poll = lambda: None
+    assert runner.is_job_process(job["pid"], job_id)
+    runner.store.update(annulee, status=RUNNING, cancel=1)
+    restarted = JobRunner(jobs_dir, max_jobs=1)
+    try:
+        assert restarted.store.get(annulee)["status"] == CANCELLED
+        job = restarted.store.get(job_id)
+        assert job["resume"] == 1
+        assert job["status"] in (QUEUED, RUNNING)
+        wait_for(lambda: restarted.store.get(job_id)["status"] == COMPLETED, 120)
+    finally:
+        restarted.poll = lambda: None
+
+    with open(f"{restarted.job_dir(job_id)}/{job['output']}", newline="") as f:
+        scan_ids = [row["scan_id"] for row in csv.DictReader(f)]
+    codes = scans_df["ID 10 N"].tolist()
+    assert scan_ids == [code for code in codes for _ in range(ENVOIS_PAR_UNITE)]
+    assert read_json(f"{restarted.job_dir(job_id)}/progress.json")["status"] == "completed"
@@ -0,0 +1,145 @@
+"""Upload multipart et reprise sur checkpoint, sur un S3 simulé par moto."""
+
+import csv
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from conftest import ENVOIS_PAR_UNITE, SCRIPT, open_uploads, read_json, write_scans
+from tracabilite import S3_BUCKET, S3_DIR, S3MultipartUploader
+
+MIB = 1024 * 1024
+PART_SIZE = 5 * MIB
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=S3_BUCKET)
+        yield client
+
+
+def write(path, size: int, mode: str = "wb"):
+    with open(path, mode) as f:
+        f.write(os.urandom(size))
+
+
+def uploaded(client, key: str) -> bytes:
+    return client.get_object(Bucket=S3_BUCKET, Key=key)["Body"].read()
+
+
+@pytest.mark.parametrize(
+    "size, parts_before_complete, parts",
+    [
+        (PART_SIZE - 1, 0, 1),
+        (PART_SIZE, 1, 1),
+        (PART_SIZE + 1, 1, 2),
+        (2 * PART_SIZE + 1, 2, 3),
+    ],
+)
+def test_parts_autour_de_la_taille_minimale(
+    client, tmp_path, size, parts_before_complete, parts
+):
+    path = tmp_path / "sortie.csv"
+    write(path, size)
+    uploader = S3MultipartUploader(str(path), S3_BUCKET, "sortie.csv", PART_SIZE, client)
+
+    uploader.checkpoint()
+    assert len(uploader.parts) == parts_before_complete
+    assert uploader.offset == parts_before_complete * PART_SIZE
+
+    uploader.complete()
+    assert len(uploader.parts) == parts
+    assert uploaded(client, "sortie.csv") == path.read_bytes()
+    assert open_uploads(client) == []
+
+
+def test_checkpoints_successifs(client, tmp_path):
+    path = tmp_path / "sortie.csv"
+    uploader = S3MultipartUploader(str(path), S3_BUCKET, "sortie.csv", PART_SIZE, client)
+    write(path, 3 * MIB)
+    uploader.checkpoint()
+    assert uploader.upload_id is None
+
+    write(path, 3 * MIB, "ab")
+    uploader.checkpoint()
+    assert (len(uploader.parts), uploader.offset) == (1, PART_SIZE)
+
+    write(path, 1, "ab")
+    uploader.complete()
+    assert uploaded(client, "sortie.csv") == path.read_bytes()
+
+
+def test_fichier_vide(client, tmp_path):
+    path = tmp_path / "sortie.csv"
+    path.write_bytes(b"")
+    uploader = S3MultipartUploader(str(path), S3_BUCKET, "sortie.csv", PART_SIZE, client)
+    uploader.complete()
+    assert uploader.parts == []
+    assert uploaded(client, "sortie.csv") == b""
+
+
+def test_abort(client, tmp_path):
+    path = tmp_path / "sortie.csv"
+    write(path, PART_SIZE + 1)
+    uploader = S3MultipartUploader(str(path), S3_BUCKET, "sortie.csv", PART_SIZE, client)
+    uploader.checkpoint()
+    assert len(open_uploads(client)) == 1
+
+    uploader.abort()
+    assert uploader.upload_id is None
+    assert open_uploads(client) == []
+    assert "Contents" not in client.list_objects_v2(Bucket=S3_BUCKET)
+    # Sans upload en cours, abort() ne fait rien
+    uploader.abort()
+
+
+def run_script(env, cwd, *args):
+    return subprocess.Popen(
+        [sys.executable, SCRIPT, "-i", "scans.csv", "-o", "sortie.csv",
+         "-p", "progress.json", "-w", "2", *args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def test_sigterm_puis_reprise(services, tmp_path):
+    env, client = services
+    codes = write_scans(tmp_path / "scans.csv")
+    checkpoint = tmp_path / "sortie.csv.checkpoint.json"
+
+    # Arrêt (SIGTERM) une fois au moins une part envoyée
+    process = run_script(env, tmp_path)
+    deadline = time.monotonic() + 60
+    while (read_json(checkpoint) or {}).get("upload_id") is None:
+        assert process.poll() is None and time.monotonic() < deadline
+        time.sleep(0.05)
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(30) == 128 + signal.SIGTERM
+    assert read_json(tmp_path / "progress.json")["status"] == "stopped"
+    assert open_uploads(client) == []
+    scans_done = read_json(checkpoint)["scans_done"]
+    assert 0 < scans_done < len(codes)
+
+    process = run_script(env, tmp_path, "--resume")
+    assert process.wait(120) == 0
+    assert read_json(tmp_path / "progress.json")["status"] == "completed"
+    assert not checkpoint.exists()
+    assert open_uploads(client) == []
+
+    # Chaque scan une fois, dans l'ordre, et le fichier publié est complet
+    with open(tmp_path / "sortie.csv", newline="") as f:
+        scan_ids = [row["scan_id"] for row in csv.DictReader(f)]
+    assert scan_ids == [code for code in codes for _ in range(ENVOIS_PAR_UNITE)]
+    key = f"{S3_DIR}/sortie.csv"
+    assert uploaded(client, key) == (tmp_path / "sortie.csv").read_bytes()
@@ -0,0 +1,31 @@
+"""Appels à l'API et cache local des réponses."""
+
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import tracabilite
+from tracabilite import TracabiliteCache, get_tracabilite
+
+
+def test_api_injoignable(monkeypatch):
+    # Port fermé : erreur de connexion après les nouvelles tentatives
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setenv("API_CLARINS_LOT2_ENDPOINT", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(tracabilite, "API_RETRIES", 1)
+    monkeypatch.setattr(tracabilite.thread_local, "session", None, raising=False)
+    assert get_tracabilite("1000000000") is None
+    assert tracabilite.envois_to_rows("1000000000", None) == [{"scan_id": "1000000000"}]
+
+
+def test_cache_compteurs_depuis_plusieurs_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracabilite, "get_tracabilite", lambda code: [])
+    cache = TracabiliteCache(str(tmp_path / "cache.db"), ttl=3600)
+    codes = [str(i % 50) for i in range(2000)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(cache.get_tracabilite, codes))
+    cache.close()
+    # Chaque consultation est comptée une fois (au moins 50 absences)
+    assert cache.hits + cache.misses == len(codes)
+    assert cache.misses >= 50
@@ -1,15 +1,26 @@
 import os
 import pandas as pd
 import csv
+import json
+import sqlite3
+from datetime import datetime
+from collections import deque
 from dotenv import load_dotenv
-from typing import Callable
+from typing import Callable, List
 import boto3
+import botocore
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from concurrent.futures import ThreadPoolExecutor
 import argparse
+import signal
+import time
 
 import threading
 
+from progress import ProgressReporter
+
 load_dotenv()
 
 columns_envoi = [
@@ -35,101 +46,388 @@ s3 = boto3.client(
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
 )
 
+S3_BUCKET = "ptc-phd-s3"
 S3_DIR = "gm-tracabilite"
+# Taille des parts de l'upload multipart (5 Mo minimum imposé par S3)
+S3_PART_SIZE = max(
+    5 * 1024 * 1024, int(os.getenv("TRACABILITE_S3_PART_SIZE", str(8 * 1024 * 1024)))
+)
+
+# Nombre d'appels simultanés à l'API
+WORKERS = int(os.getenv("TRACABILITE_WORKERS", "8"))
+# Nouvelles tentatives sur erreur réseau, 429 et 5xx
+API_RETRIES = int(os.getenv("TRACABILITE_RETRIES", "5"))
+API_TIMEOUT = float(os.getenv("TRACABILITE_TIMEOUT", "30"))
+# Écriture sur disque du fichier de sortie toutes les N lignes ou N secondes
+FLUSH_ROWS = int(os.getenv("TRACABILITE_FLUSH_ROWS", "500"))
+FLUSH_SECONDS = float(os.getenv("TRACABILITE_FLUSH_SECONDS", "5"))
+# Intervalle (secondes) entre deux points de sauvegarde (upload S3 + checkpoint)
+CHECKPOINT_SECONDS = float(os.getenv("TRACABILITE_CHECKPOINT_SECONDS", "10"))
 
-csv_lock = threading.Lock()
-counter_lock = threading.Lock()
-processed_rows = 0
-total_rows = 0
+thread_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    # Une session (connexions keep-alive) par thread
+    session = getattr(thread_local, "session", None)
+    if session is None:
+        retry = Retry(
+            total=API_RETRIES,
+            backoff_factor=0.5,
+            backoff_jitter=0.25,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(
+            {
+                "accept": "application/json",
+                "authorization": os.getenv("API_CLARINS_LOT2_TOKEN"),
+            }
+        )
+        thread_local.session = session
+    return session
 
 
 def get_tracabilite(code_unite: str):
-    headers = {
-        "accept": "application/json",
-        "authorization": os.getenv("API_CLARINS_LOT2_TOKEN"),
-    }
-    response = requests.get(
-        f"{os.getenv("API_CLARINS_LOT2_ENDPOINT")}/tracabilite/unite/{code_unite}",
-        headers=headers,
-    )
+    try:
+        response = get_session().get(
+            f"{os.getenv("API_CLARINS_LOT2_ENDPOINT")}/tracabilite/unite/{code_unite}",
+            timeout=API_TIMEOUT,
+        )
+    except (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.RetryError,
+    ):
+        # API injoignable après les nouvelles tentatives : ligne en erreur
+        return None
     if response.status_code == 200:
         return response.json()
+    # Liste vide : pas de traçabilité ; None : erreur (non mise en cache)
+    if response.status_code == 404:
+        return []
 
     return None
 
-def save_s3(output_file: str):
-    s3.upload_file(output_file, "ptc-phd-s3", f"{S3_DIR}/{output_file}")
+
+class TracabiliteCache:
+    """Cache local (SQLite) des réponses de l'API, valable `ttl` secondes.
+
+    Permet aux exécutions successives de ne pas redemander les unités déjà
+    résolues. Utilisable depuis plusieurs threads.
+    """
+
+    def __init__(self, path: str, ttl: float, commit_every: int = 100):
+        self.ttl = ttl
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal;")
+        self.conn.execute(
+            "create table if not exists tracabilite "
+            "(code text primary key, envois text not null, created real not null);"
+        )
+        self.conn.execute(
+            "delete from tracabilite where created < ?;", (time.time() - ttl,)
+        )
+        self.conn.commit()
+
+    def get(self, code_unite: str):
+        with self.lock:
+            row = self.conn.execute(
+                "select envois from tracabilite where code = ? and created >= ?;",
+                (code_unite, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, code_unite: str, envois: list):
+        with self.lock:
+            self.conn.execute(
+                "insert or replace into tracabilite values (?, ?, ?);",
+                (code_unite, json.dumps(envois), time.time()),
+            )
+            self.pending_writes += 1
+            if self.pending_writes >= self.commit_every:
+                self.conn.commit()
+                self.pending_writes = 0
+
+    def get_tracabilite(self, code_unite: str):
+        code_unite = str(code_unite)
+        envois = self.get(code_unite)
+        if envois is not None:
+            return envois
+
+        envois = get_tracabilite(code_unite)
+        if envois is not None:
+            self.set(code_unite, envois)
+        return envois
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def map_ordered(executor: ThreadPoolExecutor, fn: Callable, items: List, window: int):
+    """Comme `executor.map`, mais avec au plus `window` entrées en avance :
+    les résultats sont rendus dans l'ordre des entrées et la mémoire reste
+    bornée quel que soit le nombre d'entrées.
+
+    Une entrée répétée n'est calculée qu'une fois, son résultat est rendu
+    pour chaque occurrence.
+    """
+    last_index = {item: i for i, item in enumerate(items)}
+    futures = {}
+    pending = deque()
+    for i, item in enumerate(items):
+        future = futures.get(item)
+        if future is None:
+            future = executor.submit(fn, item)
+            futures[item] = future
+        if last_index[item] == i:
+            del futures[item]
+        pending.append(future)
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class S3MultipartUploader:
+    """Envoie un fichier en cours d'écriture sur S3 par upload multipart.
+
+    Chaque `checkpoint()` n'envoie que les octets écrits depuis le précédent,
+    par parts de `part_size`. `complete()` envoie la fin du fichier et publie
+    l'objet ; `abort()` abandonne l'upload sans laisser de parts sur S3.
+    """
+
+    def __init__(
+        self,
+        local_file: str,
+        bucket: str,
+        key: str,
+        part_size: int = S3_PART_SIZE,
+        client=None,
+    ):
+        self.local_file = local_file
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.client = client if client is not None else s3
+        self.upload_id = None
+        self.parts = []
+        self.offset = 0
+
+    def _upload_part(self, data: bytes):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )
+            self.upload_id = response["UploadId"]
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.offset += len(data)
+
+    def checkpoint(self, final: bool = False):
+        size = os.path.getsize(self.local_file)
+        with open(self.local_file, "rb") as f:
+            f.seek(self.offset)
+            while size - self.offset >= self.part_size:
+                self._upload_part(f.read(self.part_size))
+            # Seule la dernière part peut faire moins de part_size
+            if final and size > self.offset:
+                self._upload_part(f.read(size - self.offset))
+
+    def complete(self):
+        self.checkpoint(final=True)
+        if self.upload_id is None:
+            # Fichier vide : pas de part à assembler
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=b"")
+            return
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+        self.upload_id = None
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+            self.upload_id = None
+
+
+def envois_to_rows(scan_id: str, envois: list) -> list:
+    if envois is None or len(envois) == 0:
+        return [{"scan_id": scan_id}]
+
+    rows = []
+    for envoi in envois:
+        row = {
+            "scan_id": scan_id,
+            "type_envoi": envoi["type"],
+            "code_parallele": envoi["code_parallele"],
+            "emballage": envoi["emballage"],
+            "date_envoi": envoi["date"],
+        }
+        localisation = envoi.get("localisation")
+        if localisation is not None:
+            row["adresse_envoi"] = localisation["adresse"]
+            row["cp_envoi"] = localisation["code_postal"]
+            row["ville_envoi"] = localisation["ville"]
+            row["pays_alpha2_envoi"] = localisation["code_pays"]
+            row["pays_envoi"] = localisation["pays"]
+        rows.append(row)
+    return rows
+
+
+class CsvAppender:
+    """Ajoute les lignes au fichier de sortie au fur et à mesure.
+
+    Chaque ligne n'est écrite qu'une fois ; le fichier est vidé sur disque
+    toutes les `flush_rows` lignes ou `flush_seconds` secondes.
+    """
+
+    def __init__(
+        self,
+        output_file: str,
+        flush_rows: int = FLUSH_ROWS,
+        flush_seconds: float = FLUSH_SECONDS,
+        offset: int = None,
+    ):
+        if offset is None:
+            self.file = open(output_file, "w", newline="")
+            self.writer = csv.DictWriter(self.file, fieldnames=csv_columns)
+            self.writer.writeheader()
+        else:
+            # Reprise : les lignes écrites après le dernier checkpoint sont refaites
+            os.truncate(output_file, offset)
+            self.file = open(output_file, "a", newline="")
+            self.writer = csv.DictWriter(self.file, fieldnames=csv_columns)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+    def append_rows(self, rows: list):
+        self.writer.writerows(rows)
+        self.pending_rows += len(rows)
+        if (
+            self.pending_rows >= self.flush_rows
+            or time.monotonic() - self.last_flush >= self.flush_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def checkpoint_path(output_file: str) -> str:
+    return f"{output_file}.checkpoint.json"
+
+
+def save_checkpoint(output_file: str, state: dict):
+    """Écrit le checkpoint de façon atomique puis le copie sur S3."""
+    path = checkpoint_path(output_file)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+    s3.upload_file(path, S3_BUCKET, f"{S3_DIR}/{path}")
+
+
+def load_checkpoint(output_file: str) -> dict:
+    path = checkpoint_path(output_file)
+    if not os.path.exists(path):
+        try:
+            s3.download_file(S3_BUCKET, f"{S3_DIR}/{path}", path)
+        except botocore.exceptions.ClientError:
+            return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def clear_checkpoint(output_file: str):
+    path = checkpoint_path(output_file)
+    if os.path.exists(path):
+        os.remove(path)
+    s3.delete_object(Bucket=S3_BUCKET, Key=f"{S3_DIR}/{path}")
 
 
 def process_scans(
     scans_df: pd.DataFrame,
     output_file: str,
-    progress_callback: Callable[[int, str], None],
+    progress_callback: Callable[[int, int], None],
+    workers: int = WORKERS,
+    checkpoint_callback: Callable[[int, str, int], None] = None,
+    start: int = 0,
+    output_offset: int = None,
+    cache: TracabiliteCache = None,
 ):
-    res_dic = {
-        "type_envoi": [],
-        "code_parallele": [],
-        "emballage": [],
-        "date_envoi": [],
-        "adresse_envoi": [],
-        "cp_envoi": [],
-        "ville_envoi": [],
-        "pays_alpha2_envoi": [],
-        "pays_envoi": [],
-    }
-    i = 0
-    for _, row in scans_df.iterrows():
-        envois = get_tracabilite(row["ID 10 N"])
-        res_dic["scan_id"] = row["ID 10 N"]
-        if envois is not None and len(envois) > 0:
-            for envoi in envois:
-                res_dic["type_envoi"].append(envoi["type"])
-                res_dic["code_parallele"].append(envoi["code_parallele"])
-                res_dic["emballage"].append(envoi["emballage"])
-                res_dic["date_envoi"].append(envoi["date"])
-                if "localisation" in envoi and envoi["localisation"] is not None:
-                    res_dic["adresse_envoi"].append(envoi["localisation"]["adresse"])
-                    res_dic["cp_envoi"].append(envoi["localisation"]["code_postal"])
-                    res_dic["ville_envoi"].append(envoi["localisation"]["ville"])
-                    res_dic["pays_alpha2_envoi"].append(
-                        envoi["localisation"]["code_pays"]
-                    )
-                    res_dic["pays_envoi"].append(envoi["localisation"]["pays"])
-                else:
-                    for col in columns_loc:
-                        res_dic[col].append(None)
-        else:
-            for col in columns_envoi + columns_loc:
-                res_dic[col].append(None)
-
-        res_df = pd.DataFrame.from_dict(res_dic)
-        res_df.to_csv(output_file, columns=csv_columns, index=False)
-        progress_callback(
-            int(i / scans_df.shape[0] * 100),
-            f"Analyse scan {i+1}/{scans_df.shape[0]}",
-        )
-        i += 1
+    """Enrichit les scans à partir du `start`-ième.
 
-        if i % 10 == 0:
-            save_s3(output_file)
-                    
+    `progress_callback(scans_traites, nombre_de_scans)` est appelé après
+    chaque scan.
 
+    `checkpoint_callback(scans_traites, dernier_code, offset_sortie)` est
+    appelé toutes les `CHECKPOINT_SECONDS` secondes, une fois le fichier de
+    sortie vidé sur disque jusqu'à `offset_sortie`.
 
-def update_progress(progress_callback):
-    global processed_rows
-    with counter_lock:
-        processed_rows += 1
-        percentage = (processed_rows / total_rows) * 100
-        progress_callback(
-            int(percentage), f"Analyse scan {processed_rows}/{total_rows}"
-        )
+    Chaque code d'unité distinct n'est demandé qu'une fois à l'API (et pas
+    du tout s'il est dans `cache`).
+    """
+    codes = scans_df["ID 10 N"].tolist()
+    appender = CsvAppender(output_file, offset=output_offset)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    last_checkpoint = time.monotonic()
+    resolve = cache.get_tracabilite if cache is not None else get_tracabilite
+    try:
+        results = map_ordered(executor, resolve, codes[start:], workers * 4)
+        for i, (code, envois) in enumerate(zip(codes[start:], results), start=start + 1):
+            appender.append_rows(envois_to_rows(code, envois))
+            progress_callback(i, len(codes))
 
+            if (
+                checkpoint_callback is not None
+                and time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS
+            ):
+                appender.flush()
+                checkpoint_callback(i, str(code), appender.tell())
+                last_checkpoint = time.monotonic()
+    finally:
+        # En cas d'arrêt, les appels pas encore démarrés sont annulés
+        executor.shutdown(cancel_futures=True)
+        appender.close()
 
-def append_row_to_csv(row_dict):
-    with csv_lock:
-        with open("results.csv", "a", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=csv_columns)
-            writer.writerow(row_dict)
 
 if __name__ == "__main__":
 
@@ -138,24 +436,51 @@ if __name__ == "__main__":
     )
     parser.add_argument("-i", "--input")
     parser.add_argument("-o", "--output")
-    parser.add_argument("-l", "--log")
+    parser.add_argument(
+        "-p",
+        "--progress",
+        "-l",
+        "--log",
+        dest="progress",
+        help="Fichier JSON d'état de progression",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=WORKERS, help="Appels API simultanés"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reprend au dernier checkpoint et complète le fichier de sortie",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        default=os.getenv("TRACABILITE_CACHE"),
+        help="Fichier SQLite de cache des réponses de l'API",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=float(os.getenv("TRACABILITE_CACHE_TTL", "24")),
+        help="Durée de validité du cache, en heures",
+    )
     args = parser.parse_args()
 
-    if not args.input or not args.output or not args.log:
+    if not args.input or not args.output or not args.progress:
         if not args.input:
             print("Argument 'input' (-i) manquant")
         if not args.output:
             print("Argument 'output' (-o) manquant")
-        if not args.log:
-            print("Argument 'log' (-l) manquant")
+        if not args.progress:
+            print("Argument 'progress' (-p) manquant")
 
         parser.print_help()
         exit(1)
 
-    def progress_callback(progress, message):
-        print(f"{progress}%:\t{message}")
-        with open(args.log, "a") as f:
-            print(f"{os.getpid()},{progress},\"{message}\",\"{args.output}\"", file=f)
+    reporter = ProgressReporter(args.progress, args.output)
+
+    def progress_callback(done, total):
+        reporter.update(done, total, f"Analyse scan {done}/{total}")
 
     scans_df = pd.read_csv(args.input)
     if "ID 10 N" not in scans_df.columns:
@@ -165,11 +490,87 @@ if __name__ == "__main__":
         print("Il manque la colonne 'id' dans le fichier fourni")
         exit(1)
 
-    if os.path.exists(args.log):
-        os.remove(args.log)
-    with open(args.log, "a+") as f:
-        print(f"pid,%,message,filename", file=f)
-    
-    process_scans(scans_df, args.output, progress_callback)
-    progress_callback(100, "Termine")
-    save_s3(args.output)
+    def stop(signum, frame):
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, stop)
+
+    uploader = S3MultipartUploader(args.output, S3_BUCKET, f"{S3_DIR}/{args.output}")
+
+    start = 0
+    output_offset = None
+    if args.resume:
+        checkpoint = load_checkpoint(args.output)
+        if checkpoint is None:
+            print("Pas de checkpoint, le traitement repart du début")
+        else:
+            start = checkpoint["scans_done"]
+            output_offset = checkpoint["output_offset"]
+            codes = scans_df["ID 10 N"].astype(str).tolist()
+            if start > len(codes) or codes[start - 1] != checkpoint["last_code"]:
+                print("Le checkpoint ne correspond pas au fichier de scans fourni")
+                exit(1)
+            if (
+                not os.path.exists(args.output)
+                or os.path.getsize(args.output) < output_offset
+            ):
+                print(f"Fichier de sortie '{args.output}' absent ou incomplet")
+                exit(1)
+            # Upload multipart laissé ouvert par un arrêt brutal
+            if checkpoint.get("upload_id") is not None:
+                uploader.upload_id = checkpoint["upload_id"]
+                try:
+                    uploader.abort()
+                except botocore.exceptions.ClientError:
+                    # Déjà annulé lors d'un arrêt propre
+                    uploader.upload_id = None
+            print(f"Reprise après {start} scans")
+
+    def checkpoint_callback(scans_done, last_code, output_offset):
+        uploader.checkpoint()
+        save_checkpoint(
+            args.output,
+            {
+                "input": args.input,
+                "output": args.output,
+                "scans_done": scans_done,
+                "last_code": last_code,
+                "output_offset": output_offset,
+                "upload_id": uploader.upload_id,
+            },
+        )
+
+    cache = None
+    if args.cache:
+        cache = TracabiliteCache(args.cache, args.cache_ttl * 3600)
+
+    reporter.update(start, scans_df.shape[0], "Démarrage du script")
+    try:
+        process_scans(
+            scans_df,
+            args.output,
+            progress_callback,
+            args.workers,
+            checkpoint_callback,
+            start,
+            output_offset,
+            cache,
+        )
+        uploader.complete()
+    except BaseException as e:
+        uploader.abort()
+        stopped = isinstance(e, (SystemExit, KeyboardInterrupt))
+        reporter.update(
+            reporter.last_done,
+            scans_df.shape[0],
+            "Tâche stoppée" if stopped else f"Erreur : {e}",
+            "stopped" if stopped else "failed",
+        )
+        raise
+    finally:
+        if cache is not None:
+            print(f"Cache : {cache.hits} unités en cache, {cache.misses} appels API")
+            cache.close()
+    clear_checkpoint(args.output)
+    reporter.update(scans_df.shape[0], scans_df.shape[0], "Termine", "completed")
+
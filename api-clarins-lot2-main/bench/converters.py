@@ -0,0 +1,105 @@
+"""Compare la construction des modèles à partir des lignes GMDATA avec
+l'ancienne implémentation (strptime et modèles validés), sur des lignes
+synthétiques, sans base de données :
+
+    PYTHONPATH=src python bench/converters.py -u 100000 -p 1000
+"""
+
+import argparse
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from DataModels.conditionnement import Palette, Prepack, Unite
+from GMDATA.conditionnement import COLONNES, Contenu
+from GMDATA.dates import parse_timestamp
+
+
+def row_to_palette_legacy(row):
+    return Palette(
+        code_para=row[0],
+        code_article=row[1],
+        lot=row[2],
+        date_creation=datetime.strptime(row[3], "%Y%m%d%H%M%S"),
+    )
+
+
+def row_to_unite_legacy(row):
+    prepack = Prepack(
+        code_para=row[4],
+        code_article=row[5],
+        lot=row[6],
+        date_creation=datetime.strptime(row[7], "%Y%m%d%H%M%S"),
+        palette=row_to_palette_legacy(row),
+    )
+    return Unite(code_para=row[8], prepack=prepack)
+
+
+# Même forme que les lignes de `iter_contenu` (curseur `namedtuple_row`)
+Ligne = namedtuple("Ligne", [nom for colonnes in COLONNES.values() for nom in colonnes])
+
+
+def make_rows(unites: int, prepacks: int):
+    rows = []
+    for i in range(unites):
+        p = i % prepacks
+        rows.append(
+            Ligne(
+                f"PA{p // 10:08d}",
+                "C012345",
+                f"LOT{p // 10:05d}",
+                f"202401{p // 10 % 28 + 1:02d}120000",
+                f"PK{p:08d}",
+                "C012345",
+                f"LOT{p // 10:05d}",
+                f"202401{p % 28 + 1:02d}11{p % 60:02d}00",
+                f"U{i:010d}",
+            )
+        )
+    rows.sort(key=lambda row: (row.pk_code, row.uni_code))
+    return rows
+
+
+def measure(name: str, fn, rows):
+    parse_timestamp.cache_clear()
+    start = time.perf_counter()
+    fn(rows)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28}{elapsed * 1000:>10.1f} ms{len(rows) / elapsed:>14,.0f} lignes/s")
+
+
+def legacy_models(rows):
+    return [row_to_unite_legacy(row) for row in rows]
+
+
+def contenu_models(rows):
+    contenu = Contenu()
+    return [contenu.unite(row) for row in rows]
+
+
+def legacy_ndjson(rows):
+    return b"".join(
+        row_to_unite_legacy(row).model_dump_json(exclude_none=True).encode() + b"\n"
+        for row in rows
+    )
+
+
+def contenu_ndjson(rows):
+    contenu = Contenu()
+    return b"".join(contenu.unite_json(row) + b"\n" for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="converters")
+    parser.add_argument("-u", "--unites", type=int, default=100000)
+    parser.add_argument("-p", "--prepacks", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.unites, args.prepacks)
+    # Les deux implémentations doivent produire le même NDJSON
+    assert legacy_ndjson(rows[:1000]) == contenu_ndjson(rows[:1000])
+
+    measure("modeles (ancien)", legacy_models, rows)
+    measure("modeles (Contenu)", contenu_models, rows)
+    measure("ndjson (ancien)", legacy_ndjson, rows)
+    measure("ndjson (Contenu.unite_json)", contenu_ndjson, rows)
@@ -0,0 +1,154 @@
+"""Charge l'API à concurrence fixe, endpoint par endpoint, et écrit le débit
+et les latences (p50/p95/p99) en JSON.
+
+Les codes interrogés sont tirés de la base (par exemple celle créée par
+`bench/seed.py`) ; l'API doit tourner sur cette même base. Pour mesurer la
+base plutôt que le cache de réponses, lancer l'API avec `CACHE_MAX_ENTRIES=0`.
+
+    PYTHONPATH=src python bench/load.py --url http://localhost:8000 \\
+        --dsn postgresql://localhost/gmdata_bench -c 1 8 32 -n 500 -o resultats.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import httpx
+import psycopg
+from dotenv import load_dotenv
+
+SAMPLES = {
+    "article": "select trim(maarti) from martip00",
+    "palette": "select trim(cppale) from cpalep00",
+    "prepack": "select trim(cppara) from cparap00",
+    "unite": "select trim(cpunit) from cpkunp00",
+    "lot": "select distinct trim(cpbano) from cparap00",
+}
+
+# nom -> (méthode, chemin, type de code, taille du corps pour les POST)
+ENDPOINTS = {
+    "article": ("GET", "/article/{code}", "article", None),
+    "palette": ("GET", "/palette/{code}", "palette", None),
+    "prepack": ("GET", "/prepack/{code}", "prepack", None),
+    "unite": ("GET", "/unite/{code}", "unite", None),
+    "tracabilite_unite": ("GET", "/tracabilite/unite/{code}", "unite", None),
+    "tracabilite_unites": ("POST", "/tracabilite/unites", "unite", 100),
+    "palette_contenu": ("GET", "/palette/{code}/contenu?format=ndjson", "palette", None),
+    "prepack_contenu": ("GET", "/prepack/{code}/contenu", "prepack", None),
+    "tracabilite_export": ("GET", "/tracabilite/export?lot={code}", "lot", None),
+}
+
+
+def sample_codes(dsn: str, size: int) -> dict:
+    codes = {}
+    with psycopg.connect(dsn) as conn:
+        for kind, query in SAMPLES.items():
+            rows = conn.execute(
+                f"select * from ({query}) as s order by random() limit %s;", (size,)
+            ).fetchall()
+            codes[kind] = [row[0] for row in rows]
+    return codes
+
+
+async def run_level(client, endpoint: str, codes: list, concurrency: int, requests: int):
+    method, path, _, batch = ENDPOINTS[endpoint]
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            if batch is None:
+                url = path.format(code=codes[i % len(codes)])
+                body = None
+            else:
+                url = path
+                body = random.sample(codes, min(batch, len(codes)))
+            start = time.perf_counter()
+            try:
+                # Le corps est lu en entier, y compris pour les réponses streamées
+                response = await client.request(method, url, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100)
+    else:
+        percentiles = latencies * 99
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+async def run(args):
+    codes = sample_codes(args.dsn, args.sample)
+    headers = {"authorization": args.api_key or ""}
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(
+        base_url=args.url, headers=headers, limits=limits, timeout=args.timeout
+    ) as client:
+        for endpoint in args.endpoints:
+            endpoint_codes = codes[ENDPOINTS[endpoint][2]]
+            for concurrency in args.concurrency:
+                result = await run_level(
+                    client, endpoint, endpoint_codes, concurrency, args.requests
+                )
+                results.append(result)
+                print(
+                    f"{endpoint:<20}c={concurrency:<4}{result['throughput']:>9.1f} req/s"
+                    f"  p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms"
+                    f"  p99 {result['p99_ms']:>8.1f} ms  erreurs {result['errors']}",
+                    file=sys.stderr,
+                )
+
+    report = {
+        "url": args.url,
+        "requests_per_level": args.requests,
+        "sample": args.sample,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="load")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--dsn", required=True, help="Base où tirer les codes")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"))
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("-n", "--requests", type=int, default=500, help="Requêtes par palier")
+    parser.add_argument("-s", "--sample", type=int, default=1000, help="Codes tirés par type")
+    parser.add_argument(
+        "-e", "--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS)
+    )
+    parser.add_argument("-t", "--timeout", type=float, default=60)
+    parser.add_argument("-o", "--output", help="Fichier JSON (sinon sur la sortie standard)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
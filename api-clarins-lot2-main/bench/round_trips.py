@@ -0,0 +1,97 @@
+"""Compare le nombre d'allers-retours PostgreSQL de `get_tracabilite` avec
+l'ancienne implémentation (une requête de localisation par envoi).
+
+Utilise la base configurée dans le `.env` :
+
+    PYTHONPATH=src python bench/round_trips.py 9284033015 9500484525
+"""
+
+import argparse
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from psycopg import AsyncConnection, AsyncCursor
+
+import GMDATA.tracabilite as tracabilite
+from GMDATA.db import conn_params
+
+
+class CountingCursor(AsyncCursor):
+    executes = 0
+
+    async def execute(self, *args, **kwargs):
+        CountingCursor.executes += 1
+        return await super().execute(*args, **kwargs)
+
+
+async def get_tracabilite_n_plus_1(conn, code_para: str):
+    async with conn.cursor() as cur:
+        await cur.execute("select * from get_envois(%s);", (code_para,))
+        rows = await cur.fetchall()
+
+        points_tracabilite = []
+        for row_traca in rows:
+            point = tracabilite.row_to_tracabilite(row_traca)
+            if point.type == "Envoi Amiens":
+                query = (
+                    "select trim(aclvcd), trim(aclnom), trim(aclad2), trim(aclad1), trim(aclpos), "
+                    "trim(aclvil), trim(accpay), trim(acfaci) "
+                    "from acliep00 where aclvcd=%s and acfaci=%s limit 1;"
+                )
+                await cur.execute(query, (row_traca[5], row_traca[6]))
+                point.localisation = tracabilite.row_aclie_to_localisation(
+                    await cur.fetchone()
+                )
+            elif point.type == "Envoi Filiale":
+                query = (
+                    "select trim(fccusf), trim(fcnomf), trim(fcadrf), trim(fccodf), "
+                    "trim(fcvilf), trim(fcpayf), trim(fcsite) "
+                    "from fcliep00 where fccusf=%s and fcsite=%s limit 1;"
+                )
+                await cur.execute(query, (row_traca[5], row_traca[7]))
+                point.localisation = tracabilite.row_fclie_to_localisation(
+                    await cur.fetchone()
+                )
+            points_tracabilite.append(point)
+    return points_tracabilite
+
+
+async def run(codes, repeat: int):
+    conn = await AsyncConnection.connect(
+        **{k: v for k, v in conn_params.items() if v is not None},
+        cursor_factory=CountingCursor,
+    )
+
+    @asynccontextmanager
+    async def get_connection():
+        yield conn
+
+    # Toutes les requêtes de GMDATA.tracabilite passent par la connexion comptée
+    tracabilite.get_connection = get_connection
+
+    implementations = {
+        "n+1": lambda code: get_tracabilite_n_plus_1(conn, code),
+        "batch": tracabilite.get_tracabilite,
+    }
+    print(f"{'code':<20}{'impl':<8}{'points':>8}{'requetes':>10}{'ms':>10}")
+    for code in codes:
+        for name, impl in implementations.items():
+            CountingCursor.executes = 0
+            start = time.perf_counter()
+            for _ in range(repeat):
+                points = await impl(code)
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            executes = CountingCursor.executes // repeat
+            print(f"{code:<20}{name:<8}{len(points):>8}{executes:>10}{elapsed:>10.2f}")
+
+    await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="round_trips")
+    parser.add_argument("codes", nargs="+", help="Codes d'unités à tracer")
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.codes, args.repeat))
@@ -0,0 +1,201 @@
+"""Crée une base GMDATA synthétique pour `bench/load.py` : les tables lues
+par l'API, remplies à l'échelle demandée, et une fonction `get_envois()` de
+substitution (envois Amiens de chaque palette, envois filiale d'une palette
+sur deux).
+
+Les tables existantes sont supprimées : à n'utiliser que sur une base dédiée.
+
+    PYTHONPATH=src python bench/seed.py --dsn postgresql://localhost/gmdata_bench \\
+        --palettes 2000 --prepacks 10 --unites 20 --indexes ../create_index.txt
+"""
+
+import argparse
+import time
+
+import psycopg
+
+TABLES = """
+drop table if exists martip00, cpalep00, cparap00, cpapkp00, cpkunp00,
+    acliep00, fcliep00, aparap00, aeprep00, fparap00;
+
+create table martip00 (maarti char(15), madesi char(60), maname char(60),
+    malign char(10), matypp char(10), mamarq char(5), mafami char(15),
+    mage13 char(30), mapara char(1), maqtpk numeric(15), maqtpa numeric(15),
+    maacti char(1));
+create table cpalep00 (cppale char(20), cparti char(15), cpmfno numeric(7),
+    cpbano char(12), cpdate char(14), cpnopa numeric(3));
+create table cparap00 (cppara char(20), cparti char(15), cpmfno numeric(7),
+    cpbano char(12), cpdate char(14));
+create table cpapkp00 (cppara char(20), cppale char(20), cparti char(15),
+    cbano char(12), cpdate char(14));
+create table cpkunp00 (cpunit char(20), cppara char(20), cparti char(15),
+    cbano char(12), cpdate char(14));
+create table acliep00 (aclvcd char(13), aclnom char(35), aclad2 char(35),
+    aclad1 char(35), aclpos char(10), aclvil char(35), accpay char(3),
+    acfaci char(3));
+create table fcliep00 (fccusf char(15), fcnomf char(50), fcadrf char(70),
+    fccodf char(20), fcvilf char(50), fcpayf char(50), fcsite char(2));
+create table aparap00 (alncol char(20), alnpre numeric(13), alarti char(15),
+    alloti char(15), alemba char(5), alpara char(20), aldate char(14));
+create table aeprep00 (aenpre numeric(13), aedatp char(14), aelvcd char(13),
+    aefaci char(3), aencde numeric(10), aedatc char(14));
+create table fparap00 (fppara char(20), fpcusf char(15), fparti char(15),
+    fpdate char(14), fpmfno char(20), fpncdf char(30), fpsite char(20),
+    fpemba char(20), fpqtec char(20), fpqpar char(20), fperro char(20),
+    fpindt char(20), fpinfi char(60), ftag10 char(10));
+"""
+
+# Mêmes colonnes et même ordre que la fonction de production
+GET_ENVOIS = """
+create or replace function get_envois(text)
+returns table (type_envoi text, code_para text, arti text, emba text,
+    date_envoi text, code_client text, faci text, site text)
+language sql stable as $$
+    with codes as (
+        select $1::bpchar as code
+        union all
+        select uni.cppara from cpkunp00 as uni where uni.cpunit = $1::bpchar
+        union all
+        select papk.cppale from cpkunp00 as uni
+        join cpapkp00 as papk on (papk.cppara = uni.cppara)
+        where uni.cpunit = $1::bpchar
+        union all
+        select papk.cppale from cpapkp00 as papk where papk.cppara = $1::bpchar
+    )
+    select * from (
+        select 'envoi_amiens', trim(ap.alpara), trim(ap.alarti), trim(ap.alemba),
+            trim(ap.aldate), ae.aelvcd::text, ae.aefaci::text, null::text
+        from codes
+        join aparap00 as ap on (ap.alpara = codes.code)
+        join aeprep00 as ae on (ae.aenpre = ap.alnpre)
+        union all
+        select 'envoi_filiale', trim(fp.fppara), trim(fp.fparti), trim(fp.fpemba),
+            trim(fp.fpdate), fp.fpcusf::text, null::text, fp.fpsite::text
+        from codes
+        join fparap00 as fp on (fp.fppara = codes.code)
+    ) as envois
+    order by 5;
+$$;
+"""
+
+# Codes : PA0000000001, PK0000000001, U000000000001, A0000001, C0000001...
+# Palette p : article p % articles, lot p / 10, créée à 2024-01-01 + p * 10 min
+DATA = [
+    """
+    insert into martip00 (maarti, madesi, maname, mage13, maqtpk, maqtpa, maacti)
+    select 'A' || lpad(a::text, 7, '0'), 'ARTICLE ' || a, 'PRODUCT ' || a,
+        lpad(a::text, 13, '0'), %(unites)s, %(unites)s * %(prepacks)s, '1'
+    from generate_series(1, %(articles)s) as a;
+    """,
+    """
+    insert into cpalep00 (cppale, cparti, cpbano, cpdate)
+    select 'PA' || lpad(p::text, 10, '0'),
+        'A' || lpad((p %% %(articles)s + 1)::text, 7, '0'),
+        'L' || lpad((p / 10)::text, 7, '0'),
+        to_char(timestamp '2024-01-01' + p * interval '10 minutes', 'YYYYMMDDHH24MISS')
+    from generate_series(1, %(palettes)s) as p;
+    """,
+    """
+    insert into cparap00 (cppara, cparti, cpbano, cpdate)
+    select 'PK' || lpad(k::text, 10, '0'),
+        'A' || lpad((p %% %(articles)s + 1)::text, 7, '0'),
+        'L' || lpad((p / 10)::text, 7, '0'),
+        to_char(timestamp '2024-01-01' + p * interval '10 minutes', 'YYYYMMDDHH24MISS')
+    from (
+        select k, (k - 1) / %(prepacks)s + 1 as p
+        from generate_series(1, %(palettes)s * %(prepacks)s) as k
+    ) as s;
+    """,
+    """
+    insert into cpapkp00 (cppara, cppale)
+    select 'PK' || lpad(k::text, 10, '0'),
+        'PA' || lpad(((k - 1) / %(prepacks)s + 1)::text, 10, '0')
+    from generate_series(1, %(palettes)s * %(prepacks)s) as k;
+    """,
+    """
+    insert into cpkunp00 (cpunit, cppara)
+    select 'U' || lpad(u::text, 12, '0'),
+        'PK' || lpad(((u - 1) / %(unites)s + 1)::text, 10, '0')
+    from generate_series(1, %(palettes)s * %(prepacks)s * %(unites)s) as u;
+    """,
+    """
+    insert into acliep00
+    select 'C' || lpad(c::text, 7, '0'), 'CLIENT ' || c, 'BAT ' || c,
+        c || ' RUE DE LA PAIX ', lpad((c %% 95000)::text, 5, '0'), 'VILLE ' || c,
+        (array['FR', 'IT', 'DE', 'ES', 'GB', 'US', 'JP', 'CN'])[c %% 8 + 1], '001'
+    from generate_series(1, %(clients)s) as c;
+    """,
+    """
+    insert into fcliep00
+    select 'F' || lpad(c::text, 7, '0'), 'FILIALE ' || c, c || ' MAIN STREET',
+        lpad((c %% 95000)::text, 5, '0'), 'VILLE ' || c,
+        (array['FRANCE', 'ITALIE', 'ALLEMAGNE', 'ESPAGNE', 'ROYAUME UNI',
+            'ETATS-UNIS', 'JAPON', 'CHINE'])[c %% 8 + 1], '01'
+    from generate_series(1, %(clients)s) as c;
+    """,
+    """
+    insert into aparap00 (alncol, alnpre, alarti, alloti, alemba, alpara, aldate)
+    select 'COL' || p, p, cparti, cpbano, 'PA', cppale,
+        to_char(timestamp '2024-01-02' + p * interval '10 minutes', 'YYYYMMDDHH24MISS')
+    from (select row_number() over () as p, * from cpalep00) as pa;
+    """,
+    """
+    insert into aeprep00 (aenpre, aedatp, aelvcd, aefaci, aencde, aedatc)
+    select alnpre, aldate, 'C' || lpad((alnpre %% %(clients)s + 1)::text, 7, '0'),
+        '001', alnpre, aldate
+    from aparap00;
+    """,
+    """
+    insert into fparap00 (fppara, fpcusf, fparti, fpdate, fpsite, fpemba)
+    select cppale, 'F' || lpad((p %% %(clients)s + 1)::text, 7, '0'), cparti,
+        to_char(timestamp '2024-01-05' + p * interval '10 minutes', 'YYYYMMDDHH24MISS'),
+        '01', 'PA'
+    from (select row_number() over () as p, * from cpalep00) as pa
+    where p %% 2 = 0;
+    """,
+]
+
+
+def seed(dsn: str, scale: dict, indexes: str = None):
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(TABLES)
+        conn.execute(GET_ENVOIS)
+        for query in DATA:
+            start = time.perf_counter()
+            cur = conn.execute(query, scale)
+            table = query.split()[2]
+            print(f"{table:<10}{cur.rowcount:>12} lignes{time.perf_counter() - start:>8.1f} s")
+        if indexes is not None:
+            with open(indexes, encoding="utf-8") as f:
+                conn.execute(f.read())
+            print(f"Index créés ({indexes})")
+        conn.execute(
+            "analyze martip00, cpalep00, cparap00, cpapkp00, cpkunp00, "
+            "acliep00, fcliep00, aparap00, aeprep00, fparap00;"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="seed")
+    parser.add_argument("--dsn", required=True, help="Base dédiée au benchmark")
+    parser.add_argument("--palettes", type=int, default=1000)
+    parser.add_argument("--prepacks", type=int, default=10, help="Prepacks par palette")
+    parser.add_argument("--unites", type=int, default=20, help="Unités par prepack")
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument(
+        "--indexes", help="Fichier SQL d'index à appliquer (ex. ../create_index.txt)"
+    )
+    args = parser.parse_args()
+
+    seed(
+        args.dsn,
+        {
+            "palettes": args.palettes,
+            "prepacks": args.prepacks,
+            "unites": args.unites,
+            "articles": args.articles,
+            "clients": args.clients,
+        },
+        args.indexes,
+    )
@@ -1,6 +1,6 @@
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class Palette(BaseModel):
@@ -17,3 +17,11 @@ class Prepack(Palette):
 class Unite(BaseModel):
     code_para: str
     prepack: Optional[Prepack] = None
+
+
+class PrepackContenu(Prepack):
+    unites: List[str] = []
+
+
+class PaletteContenu(Palette):
+    prepacks: List[PrepackContenu] = []
@@ -1,15 +1,15 @@
-import psycopg2
 from typing import Tuple, Any
 
 from DataModels.article import Article
-from .db import conn_params
+from metrics import phase
+from .db import get_connection
 
 
 def row_to_article(row: Tuple[Any]) -> Article:
     if row is None:
         return None
 
-    article = Article(
+    article = Article.model_construct(
         code=row[0],
         designation=row[1],
         designation_en=row[2],
@@ -20,18 +20,15 @@ def row_to_article(row: Tuple[Any]) -> Article:
     return article
 
 
-def get_article(code: str) -> Article:
-    conn = psycopg2.connect(**conn_params)
-    cur = conn.cursor()
-
+async def get_article(code: str) -> Article:
     query = (
         "select trim(maarti), trim(madesi), trim(maname), maqtpk, maqtpa, maacti "
         "from martip00 where maarti=%s limit 1;"
     )
-    cur.execute(query, (code,))
-    row = cur.fetchone()
-
-    cur.close()
-    conn.close()
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, (code,))
+            row = await cur.fetchone()
 
-    return row_to_article(row)
+    with phase("conversion"):
+        return row_to_article(row)
@@ -1,126 +1,204 @@
-import psycopg2
-from datetime import datetime
-from typing import Tuple, Any
+from typing import AsyncIterator, Literal, Any
+from psycopg.rows import namedtuple_row
+from pydantic_core import to_json
 
 from DataModels.conditionnement import Palette, Prepack, Unite
-from .db import conn_params
-
-
-def row_to_palette(row: Tuple[Any]) -> Palette:
+from metrics import phase
+from .db import get_connection
+from .dates import parse_timestamp
+
+
+# Colonnes lues par toutes les requêtes de conditionnement (unitaires et
+# contenu), par table : les lignes sont lues par nom et non par position.
+COLONNES = {
+    "pa": {
+        "pa_code": "trim(pa.cppale)",
+        "pa_article": "trim(pa.cparti)",
+        "pa_lot": "trim(pa.cpbano)",
+        "pa_date": "trim(pa.cpdate)",
+    },
+    "pk": {
+        "pk_code": "trim(pk.cppara)",
+        "pk_article": "trim(pk.cparti)",
+        "pk_lot": "trim(pk.cpbano)",
+        "pk_date": "trim(pk.cpdate)",
+    },
+    "uni": {
+        "uni_code": "trim(uni.cpunit)",
+    },
+}
+
+
+def select(*tables: str) -> str:
+    colonnes = [
+        f"{expression} as {nom}"
+        for table in tables
+        for nom, expression in COLONNES[table].items()
+    ]
+    return "select " + ", ".join(colonnes) + " "
+
+
+# Les lignes viennent de GMDATA : les modèles sont construits sans validation.
+
+
+def row_to_palette(row: Any) -> Palette:
     if row is None:
         return None
-    palette = Palette(
-        code_para=row[0],
-        code_article=row[1],
-        lot=row[2],
-        date_creation=datetime.strptime(row[3], "%Y%m%d%H%M%S"),
+    palette = Palette.model_construct(
+        code_para=row.pa_code,
+        code_article=row.pa_article,
+        lot=row.pa_lot,
+        date_creation=parse_timestamp(row.pa_date),
     )
     return palette
 
 
-def row_to_prepack(row: Tuple[Any]) -> Prepack:
+def row_to_prepack(row: Any, palette: Palette = None) -> Prepack:
     if row is None:
         return None
 
-    palette = None
-    if row[0] is not None:
-        palette = Palette(
-            code_para=row[0],
-            code_article=row[1],
-            lot=row[2],
-            date_creation=datetime.strptime(row[3], "%Y%m%d%H%M%S"),
-        )
-    prepack = Prepack(
-        code_para=row[4],
-        code_article=row[5],
-        lot=row[6],
-        date_creation=datetime.strptime(row[7], "%Y%m%d%H%M%S"),
+    if palette is None and row.pa_code is not None:
+        palette = row_to_palette(row)
+    prepack = Prepack.model_construct(
+        code_para=row.pk_code,
+        code_article=row.pk_article,
+        lot=row.pk_lot,
+        date_creation=parse_timestamp(row.pk_date),
         palette=palette,
     )
     return prepack
 
 
-def row_to_unite(row: Tuple[Any]) -> Unite:
+def row_to_unite(row: Any, prepack: Prepack = None) -> Unite:
     if row is None:
         return None
 
-    palette = None
-    if row[0] is not None:
-        palette = Palette(
-            code_para=row[0],
-            code_article=row[1],
-            lot=row[2],
-            date_creation=datetime.strptime(row[3], "%Y%m%d%H%M%S"),
-        )
-    prepack = None
-    if row[4] is not None:
-        prepack = Prepack(
-            code_para=row[4],
-            code_article=row[5],
-            lot=row[6],
-            date_creation=datetime.strptime(row[7], "%Y%m%d%H%M%S"),
-            palette=palette,
-        )
-    unite = Unite(code_para=row[7], prepack=prepack)
+    if prepack is None and row.pk_code is not None:
+        prepack = row_to_prepack(row)
+    unite = Unite.model_construct(code_para=row.uni_code, prepack=prepack)
     return unite
 
 
-def get_palette(code_para: str) -> Palette:
-    conn = psycopg2.connect(**conn_params)
-    cur = conn.cursor()
-
-    query = (
-        "select trim(cppale), trim(cparti), trim(cpbano), trim(cpdate)"
-        "from cpalep00 where cppale=%s limit 1;"
-    )
-    cur.execute(query, (code_para,))
-    row = cur.fetchone()
-
-    cur.close()
-    conn.close()
+async def get_palette(code_para: str) -> Palette:
+    query = select("pa") + "from cpalep00 as pa where pa.cppale=%s limit 1;"
+    async with get_connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cur.execute(query, (code_para,))
+            row = await cur.fetchone()
 
-    return row_to_palette(row)
+    with phase("conversion"):
+        return row_to_palette(row)
 
 
-def get_prepack(code_para: str) -> Prepack:
-    conn = psycopg2.connect(**conn_params)
-    cur = conn.cursor()
-
-    query = (
-        "select trim(pa.cppale), trim(pa.cparti), trim(pa.cpbano), trim(pa.cpdate), "
-        "trim(pk.cppara), trim(pk.cparti), trim(pk.cpbano), trim(pk.cpdate) "
+async def get_prepack(code_para: str) -> Prepack:
+    query = select("pa", "pk") + (
         "from cparap00 as pk "
         "left join cpapkp00 as papk on (papk.cppara=pk.cppara) "
         "left join cpalep00 as pa on (papk.cppale=pa.cppale) "
         "where pk.cppara=%s limit 1;"
     )
-    cur.execute(query, (code_para,))
-    row = cur.fetchone()
-
-    cur.close()
-    conn.close()
+    async with get_connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cur.execute(query, (code_para,))
+            row = await cur.fetchone()
 
-    return row_to_prepack(row)
+    with phase("conversion"):
+        return row_to_prepack(row)
 
 
-def get_unite(code_para: str) -> Prepack:
-    conn = psycopg2.connect(**conn_params)
-    cur = conn.cursor()
-
-    query = (
-        "select trim(pa.cppale), trim(pa.cparti), trim(pa.cpbano), trim(pa.cpdate), "
-        "trim(pk.cppara), trim(pk.cparti), trim(pk.cpbano), trim(pk.cpdate), "
-        "trim(uni.cpunit) "
+async def get_unite(code_para: str) -> Unite:
+    query = select("pa", "pk", "uni") + (
         "from cpkunp00 as uni "
-        "left join cparap00 as pk on (pk.cppara=uni.cppara)"
+        "left join cparap00 as pk on (pk.cppara=uni.cppara) "
         "left join cpapkp00 as papk on (papk.cppara=pk.cppara) "
         "left join cpalep00 as pa on (papk.cppale=pa.cppale) "
         "where uni.cpunit=%s limit 1;"
     )
-    cur.execute(query, (code_para,))
-    row = cur.fetchone()
+    async with get_connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row) as cur:
+            await cur.execute(query, (code_para,))
+            row = await cur.fetchone()
+
+    with phase("conversion"):
+        return row_to_unite(row)
+
+
+class Contenu:
+    """Construit les objets d'un contenant à partir des lignes
+    (palette, prepack, unité) de `iter_contenu`, en partageant une seule
+    instance de chaque palette et de chaque prepack entre ses enfants.
+    """
+
+    def __init__(self):
+        self.palettes = {}
+        self.prepacks = {}
+        self.prepacks_json = {}
+
+    def palette(self, row: Any) -> Palette:
+        if row.pa_code is None:
+            return None
+        if row.pa_code not in self.palettes:
+            self.palettes[row.pa_code] = row_to_palette(row)
+        return self.palettes[row.pa_code]
+
+    def prepack(self, row: Any) -> Prepack:
+        if row.pk_code is None:
+            return None
+        if row.pk_code not in self.prepacks:
+            self.prepacks[row.pk_code] = row_to_prepack(row, self.palette(row))
+        return self.prepacks[row.pk_code]
+
+    def unite(self, row: Any) -> Unite:
+        if row.uni_code is None:
+            return None
+        return row_to_unite(row, self.prepack(row))
+
+    def unite_json(self, row: Any) -> bytes:
+        """JSON d'une `Unite` sans construire le modèle : le JSON de chaque
+        prepack (et de sa palette) n'est produit qu'une fois.
+        """
+        if row.uni_code is None:
+            return None
+        prepack_json = self.prepacks_json.get(row.pk_code)
+        if prepack_json is None:
+            prepack = self.prepack(row)
+            prepack_json = prepack.model_dump_json(exclude_none=True).encode()
+            self.prepacks_json[row.pk_code] = prepack_json
+        return (
+            b'{"code_para":' + to_json(row.uni_code) + b',"prepack":' + prepack_json + b"}"
+        )
 
-    cur.close()
-    conn.close()
 
-    return row_to_unite(row)
+async def iter_contenu(
+    contenant: Literal["palette", "prepack"], code_para: str
+) -> AsyncIterator[Any]:
+    """Lignes (palette, prepack, unité) de tout le contenu d'une palette ou
+    d'un prepack, en une requête lue par paquets (curseur côté serveur).
+
+    Aucune ligne si le contenant n'existe pas ; une ligne sans unité si le
+    contenant est vide.
+    """
+    query = select("pa", "pk", "uni")
+    if contenant == "palette":
+        query += (
+            "from cpalep00 as pa "
+            "left join cpapkp00 as papk on (papk.cppale=pa.cppale) "
+            "left join cparap00 as pk on (pk.cppara=papk.cppara) "
+            "left join cpkunp00 as uni on (uni.cppara=pk.cppara) "
+            "where pa.cppale=%s "
+        )
+    else:
+        query += (
+            "from cparap00 as pk "
+            "left join cpapkp00 as papk on (papk.cppara=pk.cppara) "
+            "left join cpalep00 as pa on (papk.cppale=pa.cppale) "
+            "left join cpkunp00 as uni on (uni.cppara=pk.cppara) "
+            "where pk.cppara=%s "
+        )
+    query += "order by pk.cppara, uni.cpunit;"
+
+    async with get_connection() as conn:
+        async with conn.cursor(name="contenu", row_factory=namedtuple_row) as cur:
+            await cur.execute(query, (code_para,))
+            async for row in cur:
+                yield row
@@ -0,0 +1,150 @@
+"""Données de référence pays / zones à partir de `world.csv`.
+
+Le fichier est lu au premier accès (pas à l'import), puis relu si sa date
+de modification change : la vérification est faite au plus toutes les
+`REFERENCE_RELOAD_SECONDS` secondes (0 : jamais). Le module ne dépend que de
+la bibliothèque standard pour pouvoir être réutilisé par les scripts de
+clean-locations.
+"""
+
+import csv
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import List, Mapping, NamedTuple, Tuple
+
+WORLD_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), "world.csv")
+REFERENCE_RELOAD_SECONDS = float(os.getenv("REFERENCE_RELOAD_SECONDS", "60"))
+
+
+class Pays(NamedTuple):
+    alpha2: str
+    alpha3: str
+    nom: str
+    nom_en: str
+    zone: str
+    continent: str
+    devise: str
+
+
+class Indexes(NamedTuple):
+    pays: Mapping[str, Pays]
+    name_to_alpha2: Mapping[str, str]
+    name_en_to_alpha2: Mapping[str, str]
+    zones: Mapping[str, Tuple[str, ...]]
+    continents: Mapping[str, Tuple[str, ...]]
+
+
+def normalize(value: str) -> str:
+    # Les colonnes CHAR de GMDATA sont complétées par des espaces ("IT   ")
+    if value is None:
+        return None
+    return value.strip().upper()
+
+
+def load_indexes(path: str) -> Indexes:
+    pays = {}
+    name_to_alpha2 = {}
+    name_en_to_alpha2 = {}
+    zones = {}
+    continents = {}
+    # Avec csv, "NA" (Namibie) n'est pas lu comme une valeur manquante
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            alpha2 = normalize(row["alpha2"])
+            if alpha2 in pays:
+                continue
+            pays[alpha2] = Pays(
+                alpha2=alpha2,
+                alpha3=normalize(row["alpha3"]),
+                nom=row["eplibf"],
+                nom_en=row["eplibe"],
+                zone=row["epzone"].strip(),
+                continent=row["continent"].strip(),
+                devise=normalize(row["epcdev"]),
+            )
+            name_to_alpha2.setdefault(normalize(row["eplibf"]), alpha2)
+            name_en_to_alpha2.setdefault(normalize(row["eplibe"]), alpha2)
+            # Clés normalisées comme les arguments de pays_de_zone et
+            # pays_du_continent
+            zones.setdefault(normalize(pays[alpha2].zone), []).append(alpha2)
+            continents.setdefault(normalize(pays[alpha2].continent), []).append(alpha2)
+
+    return Indexes(
+        pays=MappingProxyType(pays),
+        name_to_alpha2=MappingProxyType(name_to_alpha2),
+        name_en_to_alpha2=MappingProxyType(name_en_to_alpha2),
+        zones=MappingProxyType({k: tuple(v) for k, v in zones.items()}),
+        continents=MappingProxyType({k: tuple(v) for k, v in continents.items()}),
+    )
+
+
+class ReferenceData:
+    """Index de `world.csv` chargés à la demande et rechargés si le fichier
+    change. Un rechargement remplace tous les index d'un coup.
+    """
+
+    def __init__(self, path: str, reload_seconds: float):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.lock = threading.Lock()
+        self.indexes: Indexes = None
+        self.mtime = None
+        self.checked = 0.0
+        self.loads = 0
+
+    def get(self) -> Indexes:
+        indexes = self.indexes
+        if indexes is not None and (
+            self.reload_seconds <= 0
+            or time.monotonic() - self.checked < self.reload_seconds
+        ):
+            return indexes
+
+        with self.lock:
+            self.checked = time.monotonic()
+            mtime = os.stat(self.path).st_mtime_ns
+            if self.indexes is None or mtime != self.mtime:
+                self.indexes = load_indexes(self.path)
+                self.mtime = mtime
+                self.loads += 1
+            return self.indexes
+
+    def reload(self):
+        """Relit le fichier sans attendre `reload_seconds` (après un
+        remplacement de world.csv dont la date n'a pas changé, par exemple)."""
+        with self.lock:
+            self.indexes = None
+        self.get()
+
+
+reference = ReferenceData(WORLD_CSV, REFERENCE_RELOAD_SECONDS)
+
+
+def country_alpha2_to_name(alpha2: str) -> str:
+    pays = reference.get().pays.get(normalize(alpha2))
+    return pays.nom if pays is not None else None
+
+
+def country_name_to_alpha2(name: str) -> str:
+    indexes = reference.get()
+    name = normalize(name)
+    if name in indexes.name_to_alpha2:
+        return indexes.name_to_alpha2[name]
+    return indexes.name_en_to_alpha2.get(name)
+
+
+def get_pays(alpha2: str) -> Pays:
+    return reference.get().pays.get(normalize(alpha2))
+
+
+def pays_de_zone(zone: str) -> List[str]:
+    """Codes alpha-2 des pays d'une zone GMDATA (`epzone`)."""
+    return list(reference.get().zones.get(normalize(str(zone)), ()))
+
+
+def pays_du_continent(continent: str) -> List[str]:
+    """Codes alpha-2 des pays d'un continent (`continent` de world.csv, sans
+    tenir compte de la casse)."""
+    return list(reference.get().continents.get(normalize(continent), ()))
@@ -0,0 +1,19 @@
+from datetime import datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(value: str) -> datetime:
+    """Équivalent rapide de `datetime.strptime(value, "%Y%m%d%H%M%S")` pour
+    les colonnes CHAR(14) de GMDATA (`cpdate`, dates d'envoi).
+    """
+    if len(value) != 14 or not value.isdigit():
+        raise ValueError(f"Date GMDATA invalide : {value!r}")
+    return datetime(
+        int(value[0:4]),
+        int(value[4:6]),
+        int(value[6:8]),
+        int(value[8:10]),
+        int(value[10:12]),
+        int(value[12:14]),
+    )
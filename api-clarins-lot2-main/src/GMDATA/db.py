@@ -1,6 +1,13 @@
 import os
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+from psycopg import AsyncCursor, AsyncServerCursor
+from psycopg_pool import AsyncConnectionPool
+
+from metrics import add_phase, record_query
+
 load_dotenv()
 
 conn_params = {
@@ -10,3 +17,95 @@ conn_params = {
     "host": os.getenv("DB_HOST"),
     "port": os.getenv("DB_PORT"),
 }
+
+pool_params = {
+    "min_size": int(os.getenv("DB_POOL_MIN", "1")),
+    "max_size": int(os.getenv("DB_POOL_MAX", "10")),
+    # Temps max (en secondes) d'attente d'une connexion libre
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+}
+
+_pool: AsyncConnectionPool = None
+
+
+class TimedCursor(AsyncCursor):
+    """Curseur qui mesure et compte chaque requête (voir `metrics`)."""
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_query(query, params, time.perf_counter() - start)
+
+
+class TimedServerCursor(AsyncServerCursor):
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_query(query, params, time.perf_counter() - start)
+
+    async def fetchmany(self, size: int = 0):
+        start = time.perf_counter()
+        try:
+            return await super().fetchmany(size)
+        finally:
+            add_phase("query", time.perf_counter() - start)
+
+
+async def configure(conn):
+    conn.cursor_factory = TimedCursor
+    conn.server_cursor_factory = TimedServerCursor
+
+
+async def open_pool():
+    """Ouvre le pool de connexions partagé par toutes les fonctions GMDATA.
+
+    Les connexions sont vérifiées à chaque emprunt et remplacées si elles ont
+    été coupées par le serveur.
+    """
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            kwargs=conn_params,
+            check=AsyncConnectionPool.check_connection,
+            configure=configure,
+            open=False,
+            **pool_params,
+        )
+        await _pool.open()
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def get_pool() -> AsyncConnectionPool:
+    # Ouverture paresseuse si le module est utilisé hors de l'application FastAPI
+    if _pool is None:
+        await open_pool()
+    return _pool
+
+
+@asynccontextmanager
+async def get_connection():
+    pool = await get_pool()
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        add_phase("db_connect", time.perf_counter() - start)
+        yield conn
+
+
+def get_pool_stats() -> dict:
+    if _pool is None:
+        return {}
+    stats = _pool.get_stats()
+    in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+    stats["in_use"] = in_use
+    stats["saturation"] = in_use / stats["pool_max"]
+    return stats
@@ -1,33 +1,21 @@
-import psycopg2
-from datetime import datetime
-from typing import Tuple, Any
-import pandas as pd
-from .db import conn_params
+import os
+from typing import AsyncIterator, Dict, List, Tuple, Any
+from metrics import phase
+from .db import get_connection
+from .countries import country_alpha2_to_name, country_name_to_alpha2
+from .dates import parse_timestamp
 from DataModels.tracabilite import Tracabilite
 from DataModels.localisation import Localisation
 
-type_envoi = {"envoi_amiens": "Envoi Amiens", "envoi_filiale": "Envoi Filiale"}
-world_df = pd.read_csv("src/GMDATA/world.csv")
-
-
-def country_alpha2_to_name(alpha2: str) -> str:
-    if alpha2 in world_df["alpha2"].unique():
-        return world_df.loc[world_df.alpha2 == alpha2, ["eplibf"]].values[0][0]
-    return None
-
-
-def country_name_to_alpha2(name: str) -> str:
-    if name in world_df["eplibf"].unique():
-        return world_df.loc[world_df.eplibf == name, ["alpha2"]].values[0][0]
-    if name in world_df["eplibe"].unique():
-        return world_df.loc[world_df.eplibe == name, ["alpha2"]].values[0][0]
+# Nombre de lignes lues à la fois par l'export (et résolues ensemble)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
 
-    return None
+type_envoi = {"envoi_amiens": "Envoi Amiens", "envoi_filiale": "Envoi Filiale"}
 
 
 def row_to_tracabilite(row: Tuple[Any]) -> Tracabilite:
-    tracabilite = Tracabilite(
-        date=datetime.strptime(row[4], "%Y%m%d%H%M%S"),
+    tracabilite = Tracabilite.model_construct(
+        date=parse_timestamp(row[4]),
         type=type_envoi[row[0]],
         emballage=row[3],
         code_parallele=row[1],
@@ -40,7 +28,7 @@ def row_aclie_to_localisation(row: Tuple[Any]) -> Localisation:
     if row is None:
         return None
 
-    return Localisation(
+    return Localisation.model_construct(
         adresse=f"{row[1]} {row[3]}{row[2]}",
         code_postal=row[4],
         ville=row[5],
@@ -55,7 +43,7 @@ def row_fclie_to_localisation(row: Tuple[Any]) -> Localisation:
     if row is None:
         return None
 
-    return Localisation(
+    return Localisation.model_construct(
         adresse=f"{row[1]} {row[2]}",
         code_postal=row[3],
         ville=row[4],
@@ -66,39 +54,159 @@ def row_fclie_to_localisation(row: Tuple[Any]) -> Localisation:
     )
 
 
-def get_tracabilite(code_para: str):
-    conn = psycopg2.connect(**conn_params)
-    cur = conn.cursor()
-
-    query = "select * from get_envois(%s);"
-    cur.execute(query, (code_para,))
-    rows = cur.fetchall()
-
-    points_tracabilite = []
-    for row_traca in rows:
-        tracabilite = row_to_tracabilite(row_traca)
-        if tracabilite.type == "Envoi Amiens":
-            query = (
-                "select trim(aclvcd), trim(aclnom), trim(aclad2), trim(aclad1), trim(aclpos), "
-                "trim(aclvil), trim(accpay), trim(acfaci) "
-                "from acliep00 where aclvcd=%s and acfaci=%s limit 1;"
-            )
-            cur.execute(query, (row_traca[5], row_traca[6]))
-            row_loc = cur.fetchone()
-            localisation = row_aclie_to_localisation(row_loc)
-            tracabilite.localisation = localisation
-        elif tracabilite.type == "Envoi Filiale":
-            query = (
-                "select trim(fccusf), trim(fcnomf), trim(fcadrf), trim(fccodf), "
-                "trim(fcvilf), trim(fcpayf), trim(fcsite) "
-                "from fcliep00 where fccusf=%s and fcsite=%s limit 1;"
-            )
-            cur.execute(query, (row_traca[5], row_traca[7]))
-            row_loc = cur.fetchone()
-            localisation = row_fclie_to_localisation(row_loc)
-            tracabilite.localisation = localisation
-        points_tracabilite.append(tracabilite)
-    cur.close()
-    conn.close()
+def _key(value: str) -> str:
+    # Les colonnes CHAR de GMDATA sont complétées par des espaces
+    return value.strip() if value is not None else None
+
+
+async def get_localisations_aclie(cur, keys: List[Tuple[str, str]]) -> Dict:
+    if len(keys) == 0:
+        return {}
 
+    query = (
+        "select trim(aclvcd), trim(aclnom), trim(aclad2), trim(aclad1), trim(aclpos), "
+        "trim(aclvil), trim(accpay), trim(acfaci) "
+        "from acliep00 where (aclvcd, acfaci) in "
+        "(select * from unnest(%s::bpchar[], %s::bpchar[]));"
+    )
+    await cur.execute(query, ([k[0] for k in keys], [k[1] for k in keys]))
+    localisations = {}
+    for row_loc in await cur.fetchall():
+        localisations.setdefault(
+            (row_loc[0], row_loc[7]), row_aclie_to_localisation(row_loc)
+        )
+    return localisations
+
+
+async def get_localisations_fclie(cur, keys: List[Tuple[str, str]]) -> Dict:
+    if len(keys) == 0:
+        return {}
+
+    query = (
+        "select trim(fccusf), trim(fcnomf), trim(fcadrf), trim(fccodf), "
+        "trim(fcvilf), trim(fcpayf), trim(fcsite) "
+        "from fcliep00 where (fccusf, fcsite) in "
+        "(select * from unnest(%s::bpchar[], %s::bpchar[]));"
+    )
+    await cur.execute(query, ([k[0] for k in keys], [k[1] for k in keys]))
+    localisations = {}
+    for row_loc in await cur.fetchall():
+        localisations.setdefault(
+            (row_loc[0], row_loc[6]), row_fclie_to_localisation(row_loc)
+        )
+    return localisations
+
+
+async def rows_to_tracabilites(cur, rows_traca: List[Tuple[Any]]) -> List[Tracabilite]:
+    """Convertit les lignes de `get_envois()` en résolvant toutes les
+    localisations en une requête par table client.
+    """
+    keys_aclie = set()
+    keys_fclie = set()
+    for row_traca in rows_traca:
+        if row_traca[0] == "envoi_amiens":
+            keys_aclie.add((_key(row_traca[5]), _key(row_traca[6])))
+        elif row_traca[0] == "envoi_filiale":
+            keys_fclie.add((_key(row_traca[5]), _key(row_traca[7])))
+    localisations_aclie = await get_localisations_aclie(cur, list(keys_aclie))
+    localisations_fclie = await get_localisations_fclie(cur, list(keys_fclie))
+
+    with phase("conversion"):
+        points_tracabilite = []
+        for row_traca in rows_traca:
+            tracabilite = row_to_tracabilite(row_traca)
+            if tracabilite.type == "Envoi Amiens":
+                tracabilite.localisation = localisations_aclie.get(
+                    (_key(row_traca[5]), _key(row_traca[6]))
+                )
+            elif tracabilite.type == "Envoi Filiale":
+                tracabilite.localisation = localisations_fclie.get(
+                    (_key(row_traca[5]), _key(row_traca[7]))
+                )
+            points_tracabilite.append(tracabilite)
     return points_tracabilite
+
+
+async def get_tracabilite(code_para: str) -> List[Tracabilite]:
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            query = "select * from get_envois(%s);"
+            await cur.execute(query, (code_para,))
+            rows = await cur.fetchall()
+            return await rows_to_tracabilites(cur, rows)
+
+
+async def get_tracabilites(codes_para: List[str]) -> Dict[str, List[Tracabilite]]:
+    """Traçabilité de plusieurs unités en trois requêtes, quel que soit le
+    nombre de codes : les envois, puis les localisations Amiens et Filiale.
+    """
+    points_tracabilite = {code_para: [] for code_para in codes_para}
+    if len(codes_para) == 0:
+        return points_tracabilite
+
+    query = (
+        "select c.code, e.* "
+        "from unnest(%s::text[]) with ordinality as c(code, n) "
+        "cross join lateral get_envois(c.code) with ordinality as e "
+        "order by c.n, e.ordinality;"
+    )
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, (list(codes_para),))
+            rows = await cur.fetchall()
+            # Colonne 0: code demandé, dernière colonne: ordinality
+            tracabilites = await rows_to_tracabilites(cur, [row[1:-1] for row in rows])
+
+    for row, tracabilite in zip(rows, tracabilites):
+        points_tracabilite[row[0]].append(tracabilite)
+
+    return points_tracabilite
+
+
+async def iter_tracabilites_export(
+    lot: str = None,
+    article: str = None,
+    date_debut: str = None,
+    date_fin: str = None,
+) -> AsyncIterator[List[Tuple[str, Tracabilite]]]:
+    """Traçabilité de toutes les unités des prepacks d'un lot, d'un article
+    et/ou d'une période de création (`YYYYMMDDHHMMSS`), par paquets de
+    `(code unité, point)`.
+
+    Les lignes sont lues avec un curseur côté serveur ; les localisations de
+    chaque paquet sont résolues en une requête par table client. Les envois
+    d'une même unité sont consécutifs.
+    """
+    filtres = []
+    params = []
+    for condition, valeur in (
+        ("pk.cpbano=%s", lot),
+        ("pk.cparti=%s", article),
+        ("pk.cpdate>=%s", date_debut),
+        ("pk.cpdate<=%s", date_fin),
+    ):
+        if valeur is not None:
+            filtres.append(condition)
+            params.append(valeur)
+
+    query = (
+        "select u.code, e.* from ("
+        "select trim(uni.cpunit) as code from cparap00 as pk "
+        "join cpkunp00 as uni on (uni.cppara=pk.cppara) "
+        f"where {' and '.join(filtres)} "
+        "order by uni.cpunit"
+        ") as u "
+        "cross join lateral get_envois(u.code) with ordinality as e;"
+    )
+    async with get_connection() as conn:
+        async with conn.cursor(name="export") as cur, conn.cursor() as cur_loc:
+            await cur.execute(query, params)
+            while True:
+                rows = await cur.fetchmany(EXPORT_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                # Colonne 0: code de l'unité, dernière colonne: ordinality
+                tracabilites = await rows_to_tracabilites(
+                    cur_loc, [row[1:-1] for row in rows]
+                )
+                yield [(row[0], t) for row, t in zip(rows, tracabilites)]
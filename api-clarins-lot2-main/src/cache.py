@@ -0,0 +1,175 @@
+"""Cache des réponses des endpoints en lecture (palette, prepack, unité, article).
+
+Les corps JSON sont mis en cache par endpoint et par code, avec une durée de
+vie propre à chaque endpoint. Les 404 sont aussi mis en cache (valeur `None`)
+avec une durée de vie plus courte.
+
+Par défaut le cache est en mémoire dans chaque worker. Avec `CACHE_REDIS_URL`,
+les workers partagent un cache Redis (dépendance optionnelle `redis`).
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from metrics import phase
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "100000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+# Durées de vie en secondes, par endpoint
+CACHE_TTL = {
+    "article": int(os.getenv("CACHE_TTL_ARTICLE", "3600")),
+    "palette": int(os.getenv("CACHE_TTL_PALETTE", "86400")),
+    "prepack": int(os.getenv("CACHE_TTL_PREPACK", "86400")),
+    "unite": int(os.getenv("CACHE_TTL_UNITE", "86400")),
+}
+CACHE_TTL_NOT_FOUND = int(os.getenv("CACHE_TTL_NOT_FOUND", "60"))
+
+_NOT_FOUND = b""
+
+
+class MemoryBackend:
+    """LRU en mémoire, borné en nombre d'entrées et en octets."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.size += len(value)
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.size > self.max_bytes
+        ):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, value = self.entries.pop(key)
+        self.size -= len(value)
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisBackend:
+    """Cache partagé entre workers ; l'éviction est gérée par Redis."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(f"api-clarins-lot2:{key}")
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self.client.set(f"api-clarins-lot2:{key}", value, ex=ttl)
+
+    def get_stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """En-tête If-None-Match : liste d'ETags séparés par des virgules, faibles
+    (`W/"..."`) ou non, ou `*`. La comparaison est faible (RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # Évite que des requêtes simultanées sur un même code interrogent
+        # toutes la base : clé -> [verrou, nombre d'utilisateurs]
+        self.locks = {}
+
+    async def get_or_load(self, endpoint: str, code: str, loader) -> Tuple[bool, Any]:
+        """Rend `(trouvé, corps JSON)` en appelant `loader(code)` si la
+        réponse n'est pas en cache. `loader` rend un modèle pydantic ou None.
+        """
+        key = f"{endpoint}:{code}"
+        value = await self.backend.get(key)
+        if value is None:
+            # [verrou, requêtes qui l'attendent ou le tiennent] : l'entrée
+            # reste tant qu'elle sert, même si `loader` échoue
+            entry = self.locks.get(key)
+            if entry is None:
+                entry = self.locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    value = await self.backend.get(key)
+                    if value is None:
+                        self.misses += 1
+                        model = await loader(code)
+                        if model is None:
+                            value = _NOT_FOUND
+                            await self.backend.set(key, value, CACHE_TTL_NOT_FOUND)
+                        else:
+                            with phase("serialisation"):
+                                value = model.model_dump_json().encode()
+                            await self.backend.set(key, value, CACHE_TTL[endpoint])
+                    else:
+                        self.hits += 1
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0 and self.locks.get(key) is entry:
+                    del self.locks[key]
+        else:
+            self.hits += 1
+
+        if value == _NOT_FOUND:
+            return False, None
+        return True, value
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total > 0 else None,
+            **self.backend.get_stats(),
+        }
+
+
+def create_cache() -> ResponseCache:
+    if CACHE_REDIS_URL:
+        return ResponseCache(RedisBackend(CACHE_REDIS_URL))
+    return ResponseCache(MemoryBackend(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES))
@@ -0,0 +1,90 @@
+"""Sérialisation de l'export de traçabilité (`/tracabilite/export`).
+
+Chaque paquet de `iter_tracabilites_export` est écrit dès qu'il est lu :
+en NDJSON (une ligne par point, localisation imbriquée), ou en flux Arrow IPC
+(un record batch par paquet, localisation à plat) lisible directement par
+`pyarrow.ipc.open_stream`, pandas ou polars. Arrow nécessite la dépendance
+optionnelle `arrow` (`pyarrow`).
+"""
+
+import io
+from pydantic_core import to_json
+
+LOCALISATION_COLONNES = [
+    "adresse",
+    "code_postal",
+    "ville",
+    "pays",
+    "code_pays",
+    "code_client",
+    "code_faci",
+    "code_site",
+]
+
+
+async def stream_export_ndjson(batches):
+    async for batch in batches:
+        yield b"".join(
+            b'{"code_unite":'
+            + to_json(code_unite)
+            + b","
+            # Le JSON du point sans son accolade ouvrante
+            + tracabilite.model_dump_json(exclude_none=True).encode()[1:]
+            + b"\n"
+            for code_unite, tracabilite in batch
+        )
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("code_unite", pa.string()),
+            ("date", pa.timestamp("s")),
+            ("type", pa.string()),
+            ("emballage", pa.string()),
+            ("code_parallele", pa.string()),
+            *[(colonne, pa.string()) for colonne in LOCALISATION_COLONNES],
+        ]
+    )
+
+
+def batch_to_columns(batch) -> dict:
+    columns = {
+        "code_unite": [],
+        "date": [],
+        "type": [],
+        "emballage": [],
+        "code_parallele": [],
+        **{colonne: [] for colonne in LOCALISATION_COLONNES},
+    }
+    for code_unite, tracabilite in batch:
+        columns["code_unite"].append(code_unite)
+        columns["date"].append(tracabilite.date)
+        columns["type"].append(tracabilite.type)
+        columns["emballage"].append(tracabilite.emballage)
+        columns["code_parallele"].append(tracabilite.code_parallele)
+        localisation = tracabilite.localisation
+        for colonne in LOCALISATION_COLONNES:
+            columns[colonne].append(
+                getattr(localisation, colonne) if localisation is not None else None
+            )
+    return columns
+
+
+async def stream_export_arrow(batches):
+    import pyarrow as pa
+
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for batch in batches:
+            writer.write_batch(
+                pa.RecordBatch.from_pydict(batch_to_columns(batch), schema=schema)
+            )
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # Schéma seul si l'export est vide, puis marqueur de fin de flux
+    yield sink.getvalue()
@@ -1,6 +1,13 @@
 import os
-from fastapi import FastAPI, HTTPException
-from typing import List
+import json
+import hashlib
+import importlib.util
+from datetime import datetime
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter
+from typing import Dict, List, Literal, Optional, Union
 from fastapi import Security, Depends
 from fastapi.security.api_key import APIKeyHeader, APIKey
 from dotenv import load_dotenv
@@ -8,19 +15,47 @@ from dotenv import load_dotenv
 from DataModels.article import Article
 from DataModels.tracabilite import Tracabilite
 from DataModels.conditionnement import Unite, Prepack, Palette
+from DataModels.conditionnement import PaletteContenu, PrepackContenu
 from GMDATA.article import get_article as gm_get_article
 from GMDATA.conditionnement import get_palette as gm_get_palette
 from GMDATA.conditionnement import get_prepack as gm_get_prepack
 from GMDATA.conditionnement import get_unite as gm_get_unite
+from GMDATA.conditionnement import iter_contenu as gm_iter_contenu
+from GMDATA.conditionnement import Contenu
 from GMDATA.tracabilite import get_tracabilite as gm_get_tracabilite
+from GMDATA.tracabilite import get_tracabilites as gm_get_tracabilites
+from GMDATA.tracabilite import iter_tracabilites_export as gm_iter_tracabilites_export
+from GMDATA.db import open_pool, close_pool, get_pool_stats
+from cache import create_cache, etag_matches, CACHE_TTL
+from export import stream_export_ndjson, stream_export_arrow
+import metrics
 
 load_dotenv()
 
 API_KEY = os.getenv("API_KEY")
 API_KEY_NAME = "authorization"
 
+# Nombre max de codes acceptés par POST /tracabilite/unites
+TRACABILITE_BATCH_MAX = int(os.getenv("TRACABILITE_BATCH_MAX", "10000"))
+# Au-delà, la réponse est streamée par paquets de cette taille
+TRACABILITE_BATCH_CHUNK = int(os.getenv("TRACABILITE_BATCH_CHUNK", "500"))
+
+tracabilite_list_adapter = TypeAdapter(List[Tracabilite])
+tracabilites_adapter = TypeAdapter(Dict[str, List[Tracabilite]])
+response_cache = create_cache()
+
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
-app = FastAPI(root_path=os.getenv("ROOT_PATH", ""))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_pool()
+    yield
+    await close_pool()
+
+
+app = FastAPI(root_path=os.getenv("ROOT_PATH", ""), lifespan=lifespan)
+app.middleware("http")(metrics.metrics_middleware)
 
 
 async def get_api_key(
@@ -32,55 +67,264 @@ async def get_api_key(
         raise HTTPException(status_code=403, detail="Token non valide")
 
 
-@app.get("/article/{code}")
-async def api_get_article(code: str, api_key: APIKey = Depends(get_api_key)) -> Article:
-    article = gm_get_article(code)
-    if article is None:
-        raise HTTPException(status_code=404, detail="L'article n'as pas été retrouvé")
+async def cached_response(
+    request: Request, endpoint: str, code: str, loader, not_found: str
+) -> Response:
+    found, body = await response_cache.get_or_load(endpoint, code, loader)
+    if not found:
+        raise HTTPException(status_code=404, detail=not_found)
 
-    return article
+    headers = {
+        "ETag": f'"{hashlib.sha1(body).hexdigest()}"',
+        "Cache-Control": f"private, max-age={CACHE_TTL[endpoint]}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/article/{code}")
+async def api_get_article(
+    code: str, request: Request, api_key: APIKey = Depends(get_api_key)
+) -> Article:
+    return await cached_response(
+        request, "article", code, gm_get_article, "L'article n'as pas été retrouvé"
+    )
 
 
 @app.get("/tracabilite/unite/{code_para}")
 async def api_get_tracabilite(
     code_para, api_key: APIKey = Depends(get_api_key)
 ) -> List[Tracabilite]:
-    tracabilite = gm_get_tracabilite(code_para)
+    tracabilite = await gm_get_tracabilite(code_para)
     if len(tracabilite) == 0:
         raise HTTPException(
             status_code=404, detail="Pas de tracabilité pour cette unité."
         )
 
-    return tracabilite
+    with metrics.phase("serialisation"):
+        body = tracabilite_list_adapter.dump_json(tracabilite)
+    return Response(content=body, media_type="application/json")
+
+
+async def stream_tracabilites(codes_para: List[str]):
+    yield b"{"
+    first = True
+    for i in range(0, len(codes_para), TRACABILITE_BATCH_CHUNK):
+        chunk = await gm_get_tracabilites(codes_para[i : i + TRACABILITE_BATCH_CHUNK])
+        for code_para, tracabilite in chunk.items():
+            yield (
+                (b"" if first else b",")
+                + json.dumps(code_para).encode()
+                + b":"
+                + tracabilite_list_adapter.dump_json(tracabilite)
+            )
+            first = False
+    yield b"}"
+
+
+@app.post("/tracabilite/unites")
+async def api_get_tracabilites(
+    codes_para: List[str] = Body(...), api_key: APIKey = Depends(get_api_key)
+) -> Dict[str, List[Tracabilite]]:
+    codes_para = list(dict.fromkeys(codes_para))
+    if len(codes_para) > TRACABILITE_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop de codes demandés (max {TRACABILITE_BATCH_MAX}).",
+        )
+
+    if len(codes_para) <= TRACABILITE_BATCH_CHUNK:
+        tracabilites = await gm_get_tracabilites(codes_para)
+        with metrics.phase("serialisation"):
+            body = tracabilites_adapter.dump_json(tracabilites)
+        return Response(content=body, media_type="application/json")
+
+    return StreamingResponse(
+        stream_tracabilites(codes_para), media_type="application/json"
+    )
+
+
+@app.get("/tracabilite/export")
+async def api_export_tracabilite(
+    lot: Optional[str] = None,
+    article: Optional[str] = None,
+    date_debut: Optional[datetime] = None,
+    date_fin: Optional[datetime] = None,
+    format: Literal["ndjson", "arrow"] = "ndjson",
+    api_key: APIKey = Depends(get_api_key),
+):
+    if lot is None and article is None and date_debut is None and date_fin is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Au moins un filtre est requis (lot, article, date_debut, date_fin).",
+        )
+    if format == "arrow" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(
+            status_code=501, detail="Export Arrow indisponible (pyarrow non installé)."
+        )
+
+    batches = gm_iter_tracabilites_export(
+        lot=lot,
+        article=article,
+        date_debut=date_debut.strftime("%Y%m%d%H%M%S") if date_debut else None,
+        date_fin=date_fin.strftime("%Y%m%d%H%M%S") if date_fin else None,
+    )
+    if format == "arrow":
+        return StreamingResponse(
+            stream_export_arrow(batches),
+            media_type="application/vnd.apache.arrow.stream",
+        )
+    return StreamingResponse(
+        stream_export_ndjson(batches), media_type="application/x-ndjson"
+    )
 
 
 @app.get("/palette/{code_para}")
 async def api_get_palette(
-    code_para: str, api_key: APIKey = Depends(get_api_key)
+    code_para: str, request: Request, api_key: APIKey = Depends(get_api_key)
 ) -> Palette:
-    palette = gm_get_palette(code_para)
-    if palette is None:
-        raise HTTPException(status_code=404, detail="La palette n'as pas été retrouvée")
-    return palette
+    return await cached_response(
+        request, "palette", code_para, gm_get_palette, "La palette n'as pas été retrouvée"
+    )
 
 
 @app.get("/prepack/{code_para}")
 async def api_get_prepack(
-    code_para: str, api_key: APIKey = Depends(get_api_key)
+    code_para: str, request: Request, api_key: APIKey = Depends(get_api_key)
 ) -> Prepack:
-    prepack = gm_get_prepack(code_para)
-    if prepack is None:
-        raise HTTPException(status_code=404, detail="Le prepack n'a pas été retrouvé")
-
-    return prepack
+    return await cached_response(
+        request, "prepack", code_para, gm_get_prepack, "Le prepack n'a pas été retrouvé"
+    )
 
 
 @app.get("/unite/{code_para}")
 async def api_get_unite(
-    code_para: str, api_key: APIKey = Depends(get_api_key)
+    code_para: str, request: Request, api_key: APIKey = Depends(get_api_key)
 ) -> Unite:
-    unite = gm_get_unite(code_para)
-    if unite is None:
-        raise HTTPException(status_code=404, detail="L'unité n'a pas été retrouvée")
+    return await cached_response(
+        request, "unite", code_para, gm_get_unite, "L'unité n'a pas été retrouvée"
+    )
+
+
+async def prepend(first, rows):
+    yield first
+    async for row in rows:
+        yield row
+
+
+async def iter_contenu_items(
+    contenant: str, first: tuple, rows, compact: bool
+):
+    """Unités du contenant (mode complet), ou ses prepacks avec la liste des
+    codes de leurs unités (mode compact, sans répéter la palette).
+    """
+    contenu = Contenu()
+    prepack = None
+    async for row in prepend(first, rows):
+        if not compact:
+            unite = contenu.unite(row)
+            if unite is not None:
+                yield unite
+            continue
+
+        if row.pk_code is None:
+            continue
+        if prepack is None or prepack.code_para != row.pk_code:
+            if prepack is not None:
+                yield prepack
+            parent = contenu.prepack(row)
+            prepack = PrepackContenu(
+                code_para=parent.code_para,
+                code_article=parent.code_article,
+                lot=parent.lot,
+                date_creation=parent.date_creation,
+                palette=parent.palette if contenant == "prepack" else None,
+            )
+        if row.uni_code is not None:
+            prepack.unites.append(row.uni_code)
+    if prepack is not None:
+        yield prepack
+
+
+async def stream_ndjson(items):
+    async for item in items:
+        yield item.model_dump_json(exclude_none=True).encode() + b"\n"
+
+
+async def stream_unites_ndjson(first: tuple, rows):
+    contenu = Contenu()
+    async for row in prepend(first, rows):
+        line = contenu.unite_json(row)
+        if line is not None:
+            yield line + b"\n"
+
+
+async def contenu_response(
+    contenant: str, code_para: str, format: str, compact: bool, not_found: str
+):
+    rows = gm_iter_contenu(contenant, code_para)
+    first = await anext(rows, None)
+    if first is None:
+        await rows.aclose()
+        raise HTTPException(status_code=404, detail=not_found)
+
+    if format == "ndjson" and not compact:
+        return StreamingResponse(
+            stream_unites_ndjson(first, rows), media_type="application/x-ndjson"
+        )
+
+    items = iter_contenu_items(contenant, first, rows, compact)
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_ndjson(items), media_type="application/x-ndjson"
+        )
+
+    items = [item async for item in items]
+    if not compact:
+        return items
+    if contenant == "prepack":
+        return items[0]
+    palette = Contenu().palette(first)
+    return PaletteContenu(**palette.model_dump(), prepacks=items)
+
+
+@app.get("/palette/{code_para}/contenu", response_model_exclude_none=True)
+async def api_get_palette_contenu(
+    code_para: str,
+    format: Literal["json", "ndjson"] = "json",
+    compact: bool = False,
+    api_key: APIKey = Depends(get_api_key),
+) -> Union[List[Unite], PaletteContenu]:
+    return await contenu_response(
+        "palette", code_para, format, compact, "La palette n'as pas été retrouvée"
+    )
+
+
+@app.get("/prepack/{code_para}/contenu", response_model_exclude_none=True)
+async def api_get_prepack_contenu(
+    code_para: str,
+    format: Literal["json", "ndjson"] = "json",
+    compact: bool = False,
+    api_key: APIKey = Depends(get_api_key),
+) -> Union[List[Unite], PrepackContenu]:
+    return await contenu_response(
+        "prepack", code_para, format, compact, "Le prepack n'a pas été retrouvé"
+    )
+
+
+@app.get("/stats/pool")
+async def api_get_pool_stats(api_key: APIKey = Depends(get_api_key)) -> dict:
+    return get_pool_stats()
+
+
+@app.get("/stats/cache")
+async def api_get_cache_stats(api_key: APIKey = Depends(get_api_key)) -> dict:
+    return response_cache.get_stats()
+
 
-    return unite
+@app.get("/metrics", response_class=PlainTextResponse)
+async def api_get_metrics(api_key: APIKey = Depends(get_api_key)) -> str:
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
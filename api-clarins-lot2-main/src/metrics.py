@@ -0,0 +1,187 @@
+"""Mesures par requête et endpoint `/metrics` au format Prometheus.
+
+Le middleware ouvre un `RequestMetrics` pour chaque requête ; la couche
+GMDATA y ajoute le temps de chaque phase (attente d'une connexion, requêtes,
+conversion des lignes, sérialisation) et le nombre de requêtes SQL. Les
+totaux de chaque requête HTTP alimentent des histogrammes par route.
+
+Les mesures sont propres à chaque worker. Le journal des requêtes lentes est
+activé par `SLOW_QUERY_SECONDS`.
+"""
+
+import os
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Tuple
+
+SLOW_QUERY_SECONDS = (
+    float(os.getenv("SLOW_QUERY_SECONDS")) if os.getenv("SLOW_QUERY_SECONDS") else None
+)
+
+PHASES = ("db_connect", "query", "conversion", "serialisation")
+
+slow_query_logger = logging.getLogger("api-clarins-lot2.slow_query")
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f"{name};dur={self.phases[name] * 1000:.1f}"
+            for name in PHASES
+            if name in self.phases
+        )
+
+
+current: ContextVar[RequestMetrics] = ContextVar("request_metrics", default=None)
+
+
+def add_phase(name: str, seconds: float):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.phases[name] += seconds
+
+
+@contextmanager
+def phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+def record_query(query, params, seconds: float):
+    add_phase("query", seconds)
+    metrics = current.get()
+    if metrics is not None:
+        metrics.queries += 1
+    if SLOW_QUERY_SECONDS is not None and seconds >= SLOW_QUERY_SECONDS:
+        slow_queries.inc(())
+        slow_query_logger.warning(
+            "Requête lente (%.3f s) : %s ; paramètres : %r", seconds, query, params
+        )
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # valeurs des labels -> (compteurs par bucket, somme, nombre)
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        serie = self.series.get(labels)
+        if serie is None:
+            serie = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                serie[0][i] += 1
+        serie[1] += value
+        serie[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.series.items():
+            for bucket, bucket_count in zip(self.buckets, counts):
+                le = format_labels(self.labels, labels, le=bucket)
+                lines.append(f"{self.name}_bucket{le} {bucket_count}")
+            le = format_labels(self.labels, labels, le="+Inf")
+            lines.append(f"{self.name}_bucket{le} {count}")
+            base = format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{base} {total}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series: Dict[Tuple[str, ...], float] = defaultdict(float)
+        if not labels:
+            self.series[()] = 0
+
+    def inc(self, labels: Tuple[str, ...], value: float = 1):
+        self.series[labels] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.series.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return "\n".join(lines)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+request_duration = Histogram(
+    "api_request_duration_seconds",
+    "Durée des requêtes HTTP (jusqu'à l'envoi des en-têtes pour les réponses streamées)",
+    ("route", "method", "status"),
+    LATENCY_BUCKETS,
+)
+phase_duration = Histogram(
+    "api_phase_duration_seconds",
+    "Durée cumulée de chaque phase par requête HTTP",
+    ("route", "phase"),
+    LATENCY_BUCKETS,
+)
+request_queries = Histogram(
+    "api_request_queries",
+    "Nombre de requêtes SQL par requête HTTP",
+    ("route",),
+    (0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+slow_queries = Counter(
+    "api_slow_queries_total", "Requêtes SQL plus longues que SLOW_QUERY_SECONDS", ()
+)
+
+
+async def metrics_middleware(request, call_next):
+    metrics = RequestMetrics()
+    token = current.set(metrics)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current.reset(token)
+    elapsed = time.perf_counter() - start
+
+    # Gabarit de la route ("/palette/{code_para}") pour borner les séries
+    route = request.scope.get("route")
+    route = route.path if route is not None else "other"
+    request_duration.observe(
+        (route, request.method, str(response.status_code)), elapsed
+    )
+    request_queries.observe((route,), metrics.queries)
+    for name, seconds in metrics.phases.items():
+        phase_duration.observe((route, name), seconds)
+    if metrics.phases:
+        response.headers["Server-Timing"] = metrics.server_timing()
+    return response
+
+
+def render() -> str:
+    return (
+        "\n".join(
+            metric.render()
+            for metric in (request_duration, phase_duration, request_queries, slow_queries)
+        )
+        + "\n"
+    )
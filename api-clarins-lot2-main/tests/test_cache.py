@@ -0,0 +1,101 @@
+"""Cache de réponses, avec le backend en mémoire."""
+
+import asyncio
+
+import pytest
+
+from cache import MemoryBackend, ResponseCache, etag_matches
+from DataModels.conditionnement import Unite
+
+
+def make_cache() -> ResponseCache:
+    return ResponseCache(MemoryBackend(max_entries=100, max_bytes=1024 * 1024))
+
+
+def test_get_or_load_met_en_cache():
+    cache = make_cache()
+    appels = []
+
+    async def loader(code):
+        appels.append(code)
+        return Unite.model_construct(code_para=code, prepack=None)
+
+    async def run():
+        return [await cache.get_or_load("unite", "U1", loader) for _ in range(2)]
+
+    resultats = asyncio.run(run())
+    assert resultats == [(True, b'{"code_para":"U1","prepack":null}')] * 2
+    assert appels == ["U1"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.locks == {}
+
+
+def test_get_or_load_404_en_cache():
+    cache = make_cache()
+
+    async def loader(code):
+        return None
+
+    assert asyncio.run(cache.get_or_load("unite", "U1", loader)) == (False, None)
+
+
+def test_get_or_load_erreur_libere_le_verrou():
+    cache = make_cache()
+
+    async def loader(code):
+        raise RuntimeError("base indisponible")
+
+    for code in ("U1", "U2"):
+        with pytest.raises(RuntimeError):
+            asyncio.run(cache.get_or_load("unite", code, loader))
+    assert cache.locks == {}
+
+
+def test_get_or_load_appels_simultanes_avec_erreur():
+    cache = make_cache()
+    en_cours = 0
+    max_en_cours = 0
+    appels = 0
+
+    async def loader(code):
+        nonlocal en_cours, max_en_cours, appels
+        appels += 1
+        en_cours += 1
+        max_en_cours = max(max_en_cours, en_cours)
+        await asyncio.sleep(0.01)
+        en_cours -= 1
+        if appels == 1:
+            raise RuntimeError("base indisponible")
+        return Unite.model_construct(code_para=code, prepack=None)
+
+    async def appel():
+        try:
+            return await cache.get_or_load("unite", "U1", loader)
+        except RuntimeError:
+            return None
+
+    async def run():
+        premiers = [asyncio.create_task(appel()) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        # Arrive pendant le premier chargement (qui échoue)
+        suivants = [asyncio.create_task(appel()) for _ in range(3)]
+        return await asyncio.gather(*premiers, *suivants)
+
+    resultats = asyncio.run(run())
+    assert resultats[0] is None
+    assert all(r == (True, b'{"code_para":"U1","prepack":null}') for r in resultats[1:])
+    # Un seul chargement à la fois, et un seul après l'échec
+    assert max_en_cours == 1
+    assert appels == 2
+    assert cache.locks == {}
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"xyz"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
@@ -0,0 +1,97 @@
+"""Conversion des lignes GMDATA en modèles, sans base de données : les lignes
+ont la forme de celles des curseurs `namedtuple_row` (un champ par alias de
+`COLONNES`).
+"""
+
+import json
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from GMDATA.conditionnement import (
+    COLONNES,
+    Contenu,
+    row_to_palette,
+    row_to_prepack,
+    row_to_unite,
+    select,
+)
+
+Ligne = namedtuple("Ligne", [nom for colonnes in COLONNES.values() for nom in colonnes])
+
+# Une valeur différente par colonne : une colonne lue à la place d'une autre
+# se voit dans le modèle
+LIGNE = Ligne(
+    pa_code="PA0000000001",
+    pa_article="A0000001",
+    pa_lot="L0000001",
+    pa_date="20240101120000",
+    pk_code="PK0000000001",
+    pk_article="A0000002",
+    pk_lot="L0000002",
+    pk_date="20240102130000",
+    uni_code="U000000000001",
+)
+
+
+def test_select_aliases_match_columns():
+    aliases = re.findall(r" as (\w+)", select("pa", "pk", "uni"))
+    assert aliases == list(Ligne._fields)
+
+
+def test_row_to_palette():
+    palette = row_to_palette(LIGNE)
+    assert palette.code_para == LIGNE.pa_code
+    assert palette.code_article == LIGNE.pa_article
+    assert palette.lot == LIGNE.pa_lot
+    assert palette.date_creation == datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_row_to_prepack():
+    prepack = row_to_prepack(LIGNE)
+    assert prepack.code_para == LIGNE.pk_code
+    assert prepack.code_article == LIGNE.pk_article
+    assert prepack.lot == LIGNE.pk_lot
+    assert prepack.date_creation == datetime(2024, 1, 2, 13, 0, 0)
+    assert prepack.palette.code_para == LIGNE.pa_code
+
+
+def test_row_to_prepack_sans_palette():
+    ligne = LIGNE._replace(pa_code=None, pa_article=None, pa_lot=None, pa_date=None)
+    assert row_to_prepack(ligne).palette is None
+
+
+def test_row_to_unite_code_unite():
+    unite = row_to_unite(LIGNE)
+    assert unite.code_para == LIGNE.uni_code
+    assert unite.prepack.code_para == LIGNE.pk_code
+    assert unite.prepack.palette.code_para == LIGNE.pa_code
+
+
+def test_row_to_unite_sans_prepack():
+    ligne = Ligne(*([None] * 8), uni_code=LIGNE.uni_code)
+    unite = row_to_unite(ligne)
+    assert unite.code_para == LIGNE.uni_code
+    assert unite.prepack is None
+
+
+def test_row_none():
+    assert row_to_palette(None) is None
+    assert row_to_prepack(None) is None
+    assert row_to_unite(None) is None
+
+
+def test_contenu_partage_les_contenants():
+    contenu = Contenu()
+    autre = LIGNE._replace(uni_code="U000000000002")
+    premiere, seconde = contenu.unite(LIGNE), contenu.unite(autre)
+    assert (premiere.code_para, seconde.code_para) == (LIGNE.uni_code, autre.uni_code)
+    assert premiere.prepack is seconde.prepack
+    assert premiere.prepack.palette is contenu.palette(autre)
+
+
+def test_contenu_unite_json():
+    contenu = Contenu()
+    attendu = row_to_unite(LIGNE).model_dump_json(exclude_none=True)
+    assert json.loads(contenu.unite_json(LIGNE)) == json.loads(attendu)
+    assert json.loads(contenu.unite_json(LIGNE))["code_para"] == LIGNE.uni_code
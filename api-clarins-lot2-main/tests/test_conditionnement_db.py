@@ -0,0 +1,117 @@
+"""Requêtes de conditionnement sur une base synthétique (`bench/seed.py`).
+
+Ignorés sans `GMDATA_TEST_DSN`. Les tables de la base sont recréées : à
+n'utiliser que sur une base dédiée.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from psycopg.conninfo import conninfo_to_dict
+
+from bench.seed import seed
+from GMDATA import db
+from GMDATA.conditionnement import Contenu, get_palette, get_prepack, get_unite, iter_contenu
+
+DSN = os.getenv("GMDATA_TEST_DSN")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="GMDATA_TEST_DSN non défini")
+
+ECHELLE = {"palettes": 30, "prepacks": 2, "unites": 3, "articles": 5, "clients": 5}
+
+
+# Valeurs générées par bench/seed.py pour la palette p
+def article(p: int) -> str:
+    return f"A{p % ECHELLE['articles'] + 1:07d}"
+
+
+def lot(p: int) -> str:
+    return f"L{p // 10:07d}"
+
+
+def date_creation(p: int) -> datetime:
+    return datetime(2024, 1, 1) + timedelta(minutes=10 * p)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def base():
+    seed(DSN, ECHELLE)
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(db, "conn_params", conninfo_to_dict(DSN))
+
+
+def run(coro):
+    async def avec_pool():
+        try:
+            return await coro
+        finally:
+            await db.close_pool()
+
+    return asyncio.run(avec_pool())
+
+
+def test_get_palette():
+    palette = run(get_palette("PA0000000012"))
+    assert palette.code_para == "PA0000000012"
+    assert palette.code_article == article(12)
+    assert palette.lot == lot(12)
+    assert palette.date_creation == date_creation(12)
+
+
+def test_get_prepack():
+    # Prepack 23 : deuxième prepack de la palette 12
+    prepack = run(get_prepack("PK0000000023"))
+    assert prepack.code_para == "PK0000000023"
+    assert (prepack.code_article, prepack.lot) == (article(12), lot(12))
+    assert prepack.palette.code_para == "PA0000000012"
+
+
+def test_get_unite():
+    # Unité 68 : deuxième unité du prepack 23
+    unite = run(get_unite("U000000000068"))
+    assert unite.code_para == "U000000000068"
+    assert unite.prepack.code_para == "PK0000000023"
+    assert (unite.prepack.code_article, unite.prepack.lot) == (article(12), lot(12))
+    assert unite.prepack.palette.code_para == "PA0000000012"
+    assert unite.prepack.palette.lot == lot(12)
+
+
+def test_introuvables():
+    assert run(get_palette("PA9999999999")) is None
+    assert run(get_prepack("PK9999999999")) is None
+    assert run(get_unite("U999999999999")) is None
+
+
+async def lire_contenu(contenant: str, code_para: str):
+    contenu = Contenu()
+    return [contenu.unite(row) async for row in iter_contenu(contenant, code_para)]
+
+
+def test_iter_contenu_palette():
+    unites = run(lire_contenu("palette", "PA0000000012"))
+    assert [unite.code_para for unite in unites] == [
+        f"U{u:012d}" for u in range(67, 73)
+    ]
+    assert [unite.prepack.code_para for unite in unites] == (
+        ["PK0000000023"] * 3 + ["PK0000000024"] * 3
+    )
+    for unite in unites:
+        assert (unite.prepack.code_article, unite.prepack.lot) == (article(12), lot(12))
+        assert unite.prepack.palette.code_article == article(12)
+
+
+def test_iter_contenu_prepack():
+    unites = run(lire_contenu("prepack", "PK0000000024"))
+    assert [unite.code_para for unite in unites] == [
+        f"U{u:012d}" for u in range(70, 73)
+    ]
+    assert unites[0].prepack.palette.code_para == "PA0000000012"
+
+
+def test_iter_contenu_introuvable():
+    assert run(lire_contenu("palette", "PA9999999999")) == []
@@ -0,0 +1,73 @@
+"""Données de référence pays, sur un world.csv réduit."""
+
+import os
+
+import pytest
+
+from GMDATA import countries
+from GMDATA.countries import ReferenceData
+
+ENTETE = "eppays,eplibf,eplibe,epzone,epcoox,epcooy,epcdev,continent,id,alpha2,alpha3,name\n"
+LIGNES = [
+    "FR,FRANCE,FRANCE,1,0,0,EUR,europe,250,FR,FRA,France\n",
+    "IT,ITALIE,ITALY, 1 ,0,0,EUR,Europe ,380,IT,ITA,Italy\n",
+    "NA,NAMIBIE,NAMIBIA,7,0,0,NAD,AFRIQUE,516,NA,NAM,Namibia\n",
+]
+
+
+@pytest.fixture
+def world(tmp_path, monkeypatch):
+    path = tmp_path / "world.csv"
+    path.write_text(ENTETE + "".join(LIGNES), encoding="utf-8")
+    reference = ReferenceData(str(path), reload_seconds=0)
+    monkeypatch.setattr(countries, "reference", reference)
+    return path, reference
+
+
+def test_correspondances(world):
+    assert countries.country_alpha2_to_name("it   ") == "ITALIE"
+    assert countries.country_name_to_alpha2("Italy") == "IT"
+    assert countries.country_name_to_alpha2("namibie") == "NA"
+    assert countries.get_pays("FR").alpha3 == "FRA"
+    assert countries.get_pays("XX") is None
+
+
+def test_pays_du_continent_sans_casse(world):
+    for continent in ("europe", "EUROPE", " Europe "):
+        assert countries.pays_du_continent(continent) == ["FR", "IT"]
+    assert countries.pays_du_continent("afrique") == ["NA"]
+    assert countries.pays_du_continent("asie") == []
+
+
+def test_pays_de_zone(world):
+    assert countries.pays_de_zone(1) == ["FR", "IT"]
+    assert countries.pays_de_zone(" 7") == ["NA"]
+
+
+def test_chargement_paresseux_et_reload(world):
+    path, reference = world
+    assert reference.loads == 0
+    countries.get_pays("FR")
+    countries.get_pays("IT")
+    assert reference.loads == 1
+
+    # Même date de modification : seul reload() relit le fichier
+    stat = os.stat(path)
+    path.write_text(ENTETE + LIGNES[0], encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert countries.get_pays("IT") is not None
+    reference.reload()
+    assert reference.loads == 2
+    assert countries.get_pays("IT") is None
+
+
+def test_rechargement_si_modifie(world):
+    path, reference = world
+    reference.reload_seconds = 0.001
+    assert countries.pays_du_continent("europe") == ["FR", "IT"]
+    path.write_text(ENTETE + LIGNES[0], encoding="utf-8")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    import time
+
+    time.sleep(0.01)
+    assert countries.pays_du_continent("europe") == ["FR"]
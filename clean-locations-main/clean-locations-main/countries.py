@@ -0,0 +1,23 @@
+import importlib.util
+import os
+
+# Country index shared with the api-clarins-lot2 API (same world.csv). The
+# module is loaded from its file, without adding the API sources to sys.path.
+COUNTRIES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "api-clarins-lot2-main",
+    "src",
+    "GMDATA",
+    "countries.py",
+)
+
+_spec = importlib.util.spec_from_file_location("gmdata_countries", COUNTRIES_PATH)
+_countries = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_countries)
+
+country_alpha2_to_name = _countries.country_alpha2_to_name
+country_name_to_alpha2 = _countries.country_name_to_alpha2
+get_pays = _countries.get_pays
+normalize = _countries.normalize
@@ -0,0 +1,298 @@
+"""Geocodes a client table export (acliep00 or fcliep00) into MongoDB.
+
+The CSV rows go through three stages linked by bounded queues, so that
+reading, geocoding and writing to MongoDB overlap:
+
+    producer (rows, grouped by country) -> geocoder -> MongoDB writer
+
+Documents are upserted on (code, faci) or (code, site), so running the same
+input again does not duplicate them. Their `address` field holds the address
+sent for the client (the response may come from the cache, for the same address
+written differently), and their `updated` field the time of geocoding (see
+`mongodb_to_csv.py --since`).
+
+    python geocode_clients.py aclie <input_csv_path>
+    python geocode_clients.py fclie <input_csv_path> --refresh
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple
+
+import bson
+import pandas as pd
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient, ReplaceOne
+from tqdm import tqdm
+
+from countries import country_name_to_alpha2, normalize
+from geocoding import CACHE_PATH, RATE, WORKERS, Geocoder, GeocodingCache
+
+load_dotenv()
+MONGO_CLIENT = os.getenv("MONGO_CLIENT")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+MONGO_COLLEC_NAME = os.getenv("MONGO_COLLEC_NAME")
+
+# Bulk writes of at most N documents or N bytes, flushed at least every N seconds
+WRITE_BATCH_SIZE = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "500"))
+WRITE_BATCH_BYTES = int(os.getenv("MONGO_WRITE_BATCH_BYTES", str(8 * 1024 * 1024)))
+WRITE_FLUSH_SECONDS = float(os.getenv("MONGO_WRITE_FLUSH_SECONDS", "2"))
+
+
+def clean(value: str) -> str:
+    return value.strip().lower()
+
+
+class Source(NamedTuple):
+    columns: List[str]
+    # Column of the client code, and name and column of the second key
+    code: str
+    key: str
+    key_column: str
+    # Column the rows are grouped by, stored as "country"
+    country: str
+    country_alpha2: Callable[[str], str]
+    address: Callable[[dict], str]
+
+
+SOURCES = {
+    "aclie": Source(
+        columns=[
+            "aclvcd",
+            "aclnom",
+            "aclad2",
+            "aclad1",
+            "aclpos",
+            "aclvil",
+            "accpay",
+            "acfaci",
+        ],
+        code="aclvcd",
+        key="faci",
+        key_column="acfaci",
+        country="accpay",
+        country_alpha2=normalize,
+        address=lambda row: (
+            f"{clean(row['aclad2'])} {clean(row['aclad1'])}, "
+            f"{clean(row['aclpos'])} {clean(row['aclvil'])}, {clean(row['accpay'])}"
+        ),
+    ),
+    "fclie": Source(
+        columns=[
+            "fccusf",
+            "fcnomf",
+            "fcadrf",
+            "fccodf",
+            "fcvilf",
+            "fcpayf",
+            "fcsite",
+            "pays",
+            "continent",
+        ],
+        code="fccusf",
+        key="site",
+        key_column="fcsite",
+        country="pays",
+        country_alpha2=country_name_to_alpha2,
+        address=lambda row: (
+            f"{clean(row['fcadrf'])}, {clean(row['fccodf'])} {clean(row['fcvilf'])}, "
+            f"{clean(row['pays'])}"
+        ),
+    ),
+}
+
+# End of stream between two stages
+DONE = object()
+
+
+# A failing stage sets `stop`, so that the others do not block on the queues
+def put(q: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+
+
+def get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            pass
+    return DONE
+
+
+def produce(df: pd.DataFrame, source: Source, rows: queue.Queue, stop: threading.Event):
+    try:
+        for country, group in df.groupby(source.country, sort=True):
+            base = {
+                "country": country,
+                "country_alpha2": source.country_alpha2(country),
+                "continent": "EUROPE",
+            }
+            for row in group.to_dict("records"):
+                document = {
+                    "code": clean(row[source.code]),
+                    source.key: clean(row[source.key_column]),
+                    "address": source.address(row),
+                    **base,
+                }
+                put(rows, document, stop)
+                if stop.is_set():
+                    return
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        put(rows, DONE, stop)
+
+
+class Writer:
+    """Unordered bulk upserts keyed on (code, faci) or (code, site): a re-run
+    replaces the documents of the clients it geocodes again."""
+
+    def __init__(
+        self,
+        collection,
+        key: str,
+        batch_size: int = WRITE_BATCH_SIZE,
+        batch_bytes: int = WRITE_BATCH_BYTES,
+        flush_seconds: float = WRITE_FLUSH_SECONDS,
+    ):
+        self.collection = collection
+        self.key = key
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_seconds = flush_seconds
+        self.batch = []
+        self.size = 0
+        self.inserted = 0
+        self.replaced = 0
+
+    def add(self, document: dict):
+        self.batch.append(
+            ReplaceOne(
+                {"code": document["code"], self.key: document[self.key]},
+                document,
+                upsert=True,
+            )
+        )
+        self.size += len(bson.encode(document))
+        if len(self.batch) >= self.batch_size or self.size >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        result = self.collection.bulk_write(self.batch, ordered=False)
+        self.inserted += result.upserted_count
+        self.replaced += result.matched_count
+        self.batch = []
+        self.size = 0
+
+    def run(self, documents: queue.Queue, stop: threading.Event):
+        try:
+            self.collection.create_index([("code", ASCENDING), (self.key, ASCENDING)])
+            deadline = time.monotonic() + self.flush_seconds
+            while not stop.is_set():
+                try:
+                    document = documents.get(
+                        timeout=max(deadline - time.monotonic(), 0.01)
+                    )
+                except queue.Empty:
+                    document = None
+                if document is DONE:
+                    break
+                if document is not None:
+                    self.add(document)
+                if time.monotonic() >= deadline:
+                    self.flush()
+                    deadline = time.monotonic() + self.flush_seconds
+            self.flush()
+        except BaseException:
+            stop.set()
+            raise
+
+
+def geocode_table(
+    source: Source, df: pd.DataFrame, writer: Writer, geocoder: Geocoder, queue_size: int
+):
+    rows = queue.Queue(queue_size)
+    documents = queue.Queue(queue_size)
+    stop = threading.Event()
+    contexts = deque()
+
+    def addresses():
+        while True:
+            item = get(rows, stop)
+            if item is DONE:
+                return
+            contexts.append(item)
+            yield item["address"]
+
+    with ThreadPoolExecutor(2) as executor:
+        producer = executor.submit(produce, df, source, rows, stop)
+        writing = executor.submit(writer.run, documents, stop)
+        try:
+            with tqdm(total=df.shape[0]) as progress:
+                for response in geocoder.geocode_all(addresses()):
+                    document = contexts.popleft()
+                    response.update(document)
+                    response["updated"] = datetime.now(timezone.utc)
+                    put(documents, response, stop)
+                    progress.update()
+                    if stop.is_set():
+                        break
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            put(documents, DONE, stop)
+        producer.result()
+        writing.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="geocode_clients")
+    parser.add_argument("table", choices=list(SOURCES))
+    parser.add_argument("input", help="Input csv path")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS)
+    parser.add_argument("-r", "--rate", type=float, default=RATE, help="Requests per second")
+    parser.add_argument("-q", "--queue-size", type=int, default=1000)
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Geocode every address again, ignoring (and updating) the cache",
+    )
+    args = parser.parse_args(argv)
+
+    source = SOURCES[args.table]
+    df = pd.read_csv(args.input, dtype={col: str for col in source.columns}).fillna("")
+
+    client = MongoClient(MONGO_CLIENT)
+    collection = client[MONGO_DB_NAME][MONGO_COLLEC_NAME]
+    cache = GeocodingCache(CACHE_PATH) if CACHE_PATH else None
+    geocoder = Geocoder(
+        workers=args.workers, rate=args.rate, cache=cache, refresh=args.refresh
+    )
+    writer = Writer(collection, source.key)
+    try:
+        geocode_table(source, df, writer, geocoder, args.queue_size)
+    finally:
+        if cache is not None:
+            cache.close()
+        client.close()
+    print(geocoder.summary())
+    print(f"MongoDB: {writer.inserted} documents inserted, {writer.replaced} replaced")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Concurrent geocoding with AWS Location Service, shared by the aws_loc_* scripts.
+
+Requests run on a thread pool behind a token bucket sized to the
+SearchPlaceIndexForText quota. Throttling and transient errors are retried
+with jittered exponential backoff; an address still failing after the retries
+gets a response with an `Error` field and no results. Any object with a
+`search_place_index_for_text(IndexName=..., Text=...)` method can stand in
+for the boto3 client, and `AWS_ENDPOINT_URL_LOCATION` points boto3 at a local
+stub geocoder.
+
+With a `GeocodingCache`, addresses geocoded by a previous run less than
+`GEOCODING_CACHE_TTL` days ago (same text once normalised) are not sent again.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError,
+    ConnectionError as BotoConnectionError,
+    HTTPClientError,
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOTO3_SESSION = os.getenv("BOTO3_SESSION")
+PLACE_INDEX = os.getenv("GEOCODING_PLACE_INDEX", "geocoding-clients")
+# Parallel requests
+WORKERS = int(os.getenv("GEOCODING_WORKERS", "8"))
+# Requests per second allowed by the Location Service quota
+RATE = float(os.getenv("GEOCODING_RATE", "50"))
+# Retries on throttling and transient errors
+RETRIES = int(os.getenv("GEOCODING_RETRIES", "8"))
+# Local cache of the responses, empty to disable
+CACHE_PATH = os.getenv("GEOCODING_CACHE", "geocoding-cache.db")
+# Days a cached response stays valid
+CACHE_TTL = float(os.getenv("GEOCODING_CACHE_TTL", "90"))
+
+RETRYABLE_ERRORS = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def normalize_address(text: str) -> str:
+    """Case, Unicode form, whitespace and comma spacing do not change the key."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    return " ".join(text.split()).strip(" ,")
+
+
+def address_key(text: str) -> str:
+    return hashlib.sha1(normalize_address(text).encode("utf-8")).hexdigest()
+
+
+class GeocodingCache:
+    """Local (SQLite) cache of geocoding responses, keyed on the normalised
+    address and valid `ttl` seconds. Usable from several threads.
+    """
+
+    def __init__(
+        self, path: str, ttl: float = CACHE_TTL * 86400, commit_every: int = 100
+    ):
+        self.ttl = ttl
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal;")
+        self.conn.execute(
+            "create table if not exists geocoding "
+            "(key text primary key, address text not null, response text not null, "
+            "created real not null);"
+        )
+        self.conn.execute(
+            "delete from geocoding where created < ?;", (time.time() - ttl,)
+        )
+        self.conn.commit()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute(
+                "select response from geocoding where key = ? and created >= ?;",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, address: str, response: dict):
+        with self.lock:
+            self.conn.execute(
+                "insert or replace into geocoding values (?, ?, ?, ?);",
+                (key, address, json.dumps(response, default=str), time.time()),
+            )
+            self.pending_writes += 1
+            if self.pending_writes >= self.commit_every:
+                self.conn.commit()
+                self.pending_writes = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def make_client(workers: int = WORKERS):
+    # Retries are handled by Geocoder, with the token bucket
+    config = Config(
+        max_pool_connections=workers, retries={"total_max_attempts": 1}
+    )
+    session = boto3.Session(profile_name=BOTO3_SESSION)
+    return session.client("location", config=config)
+
+
+class Geocoder:
+    def __init__(
+        self,
+        client=None,
+        index_name: str = PLACE_INDEX,
+        workers: int = WORKERS,
+        rate: float = RATE,
+        retries: int = RETRIES,
+        cache: GeocodingCache = None,
+        refresh: bool = False,
+    ):
+        self.client = client if client is not None else make_client(workers)
+        self.index_name = index_name
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.cache = cache
+        # Geocodes again the cached addresses, and updates the cache
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.failed = 0
+        self.duplicates = 0
+
+    def geocode(self, text: str) -> dict:
+        """`search_place_index_for_text` response for `text`, without its
+        `ResponseMetadata`.
+
+        Once the retries are exhausted, the response has no `Results` and the
+        last error in `Error`. Other client errors are raised.
+        """
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            with self.lock:
+                self.calls += 1
+            try:
+                response = self.client.search_place_index_for_text(
+                    IndexName=self.index_name, Text=text
+                )
+                response.pop("ResponseMetadata", None)
+                return response
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in RETRYABLE_ERRORS:
+                    raise
+                with self.lock:
+                    self.throttled += 1
+                error = e
+            # Connection errors, connection and read timeouts
+            except (BotoConnectionError, HTTPClientError) as e:
+                error = e
+            if attempt == self.retries:
+                break
+            # Full jitter: spreads the retries of all workers over time
+            time.sleep(random.uniform(0, min(30, 0.5 * 2**attempt)))
+        with self.lock:
+            self.failed += 1
+        return {"Summary": {"Text": text}, "Results": [], "Error": str(error)}
+
+    def summary(self) -> str:
+        text = (
+            f"{self.calls} geocoding requests, {self.throttled} throttled, "
+            f"{self.failed} addresses failed"
+        )
+        if self.cache is not None:
+            text += (
+                f"; cache: {self.cache.hits} hits, {self.cache.misses} misses"
+                f" ({self.cache.hit_rate():.1%} hit rate)"
+            )
+        return text + f"; {self.duplicates} repeated addresses"
+
+    def lookup(self, key: str, text: str) -> dict:
+        if self.cache is not None and not self.refresh:
+            response = self.cache.get(key)
+            if response is not None:
+                return response
+        response = self.geocode(text)
+        # Failures are not cached, the next run tries again
+        if self.cache is not None and "Error" not in response:
+            self.cache.set(key, text, response)
+        return response
+
+    def geocode_all(self, texts: Iterable[str]) -> Iterator[dict]:
+        """Geocodes `texts` in parallel and yields the responses in input order,
+        with at most `workers * 4` requests ahead of the consumer.
+
+        An address repeated among the pending ones is looked up once. Each
+        occurrence gets its own copy of the response, which the caller may
+        modify.
+        """
+        with ThreadPoolExecutor(self.workers) as executor:
+            # key -> [future, pending occurrences]
+            futures = {}
+            pending = deque()
+
+            def next_result():
+                key = pending.popleft()
+                entry = futures[key]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del futures[key]
+                return copy.deepcopy(entry[0].result())
+
+            for text in texts:
+                key = address_key(text)
+                entry = futures.get(key)
+                if entry is None:
+                    entry = futures[key] = [executor.submit(self.lookup, key, text), 0]
+                else:
+                    self.duplicates += 1
+                entry[1] += 1
+                pending.append(key)
+                if len(pending) >= self.workers * 4:
+                    yield next_result()
+            while pending:
+                yield next_result()
@@ -1,26 +1,30 @@
-import sys
-import os
-import pandas as pd
-from pymongo import MongoClient
-from dotenv import load_dotenv
+"""Exports the geocoded addresses from MongoDB to CSV (or Parquet), one row per
+geocoding result.
 
-load_dotenv()
-MONGO_CLIENT=os.getenv("MONGO_CLIENT")
-MONGO_DB_NAME=os.getenv("MONGO_DB_NAME")
-MONGO_COLLEC_NAME=os.getenv("MONGO_COLLEC_NAME")
+Only the exported fields are read, the cursor is read in batches and the
+output is written in chunks, so memory does not grow with the collection.
 
-if len(sys.argv) < 2:
-    print("Missing parameter: output csv path")
-    sys.exit()
-CSV_PATH = sys.argv[1]
+    python mongodb_to_csv.py <output_csv_path>
+    python mongodb_to_csv.py out.parquet --country FR IT --since 2024-06-01
+"""
 
-client = MongoClient(MONGO_CLIENT)
-db = client[MONGO_DB_NAME]
-collection = db[MONGO_COLLEC_NAME]
+import argparse
+import importlib.util
+import os
+import re
+from datetime import datetime, timezone
 
-entries = collection.find({"continent": "EUROPE"})
+import pandas as pd
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
 
-csv_rows = []
+from countries import get_pays
+
+load_dotenv()
+MONGO_CLIENT = os.getenv("MONGO_CLIENT")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+MONGO_COLLEC_NAME = os.getenv("MONGO_COLLEC_NAME")
 
 place_attrs = [
     "AddressNumber",
@@ -29,37 +33,188 @@ place_attrs = [
     "PostalCode",
     "Region",
     "SubRegion",
-    "Street"
+    "Street",
+]
+
+COLUMNS = [
+    *(attr.lower() for attr in place_attrs),
+    "long",
+    "lat",
+    "relevance",
+    "raw_address",
+    "code",
+    "faci",
+    "site",
 ]
 
-for i, entry in enumerate(entries):
-    
-    raw_address = entry["Summary"]["Text"]
+PROJECTION = {
+    "_id": 0,
+    "address": 1,
+    "Summary.Text": 1,
+    **{f"Results.Place.{attr}": 1 for attr in place_attrs},
+    "Results.Place.Geometry.Point": 1,
+    "Results.Relevance": 1,
+    "code": 1,
+    "faci": 1,
+    "site": 1,
+}
+
+
+def legacy_country_values(alpha2: str):
+    """Values of the `country` field (input column, padded or not) for
+    `alpha2`: the code itself, or its French or English name."""
+    values = [alpha2]
+    pays = get_pays(alpha2)
+    if pays is not None:
+        values += [pays.nom, pays.nom_en]
+    return [
+        re.compile(rf"^\s*{re.escape(value)}\s*$", re.IGNORECASE)
+        for value in values
+        if value
+    ]
+
+
+def build_filter(continent: str = None, countries=None, since: datetime = None) -> dict:
+    clauses = []
+    if continent is not None:
+        clauses.append({"continent": continent})
+    if countries:
+        clauses.append(
+            {
+                "$or": [
+                    {"country_alpha2": {"$in": countries}},
+                    # Documents written before the `country_alpha2` field existed
+                    {
+                        "country_alpha2": {"$exists": False},
+                        "country": {
+                            "$in": [
+                                value
+                                for country in countries
+                                for value in legacy_country_values(country)
+                            ]
+                        },
+                    },
+                ]
+            }
+        )
+    if since is not None:
+        clauses.append(
+            {
+                "$or": [
+                    {"updated": {"$gte": since}},
+                    # Documents written before the `updated` field existed
+                    {
+                        "updated": {"$exists": False},
+                        "_id": {"$gte": ObjectId.from_datetime(since)},
+                    },
+                ]
+            }
+        )
+    if len(clauses) > 1:
+        return {"$and": clauses}
+    return clauses[0] if clauses else {}
 
-    for res in entry["Results"]:
-        csv_row = {}
+
+def entry_to_rows(entry: dict):
+    # Documents written before the `address` field existed
+    raw_address = entry.get("address") or entry["Summary"]["Text"]
+    for res in entry.get("Results", []):
         place = res["Place"]
-        for place_attr in place_attrs:
-            if place_attr in place:
-                csv_row[place_attr.lower()] = place[place_attr]
-            else:
-                #print("=======")
-                #print(entry["code"], entry["faci"])
-                #print(raw_address)
-                #print(place_attr)
-                #print(place)
-                csv_row[place_attr.lower()] = None
-
-        #if entry["code"] == "800629":
-        #    print(place)
-
-        csv_row["long"] = place["Geometry"]["Point"][0]
-        csv_row["lat"] = place["Geometry"]["Point"][1]
-        csv_row["relevance"] = res["Relevance"]
-        csv_row["raw_address"] = raw_address
-        csv_row["code"] = entry["code"]
-        csv_row["faci"] = entry["faci"]
-        csv_rows.append(csv_row)
-
-df = pd.DataFrame.from_dict(csv_rows)
-df.to_csv(CSV_PATH, index=False)
+        row = {attr.lower(): place.get(attr) for attr in place_attrs}
+        row["long"], row["lat"] = place["Geometry"]["Point"][:2]
+        row["relevance"] = res["Relevance"]
+        row["raw_address"] = raw_address
+        row["code"] = entry.get("code")
+        row["faci"] = entry.get("faci")
+        row["site"] = entry.get("site")
+        yield row
+
+
+def iter_chunks(collection, query: dict, batch_size: int, chunk_rows: int):
+    cursor = collection.find(query, PROJECTION, batch_size=batch_size)
+    rows = []
+    for entry in cursor:
+        rows.extend(entry_to_rows(entry))
+        if len(rows) >= chunk_rows:
+            yield pd.DataFrame(rows, columns=COLUMNS)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows, columns=COLUMNS)
+
+
+def write_csv(chunks, path: str) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        pd.DataFrame(columns=COLUMNS).to_csv(f, index=False)
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=False)
+            count += chunk.shape[0]
+    return count
+
+
+def write_parquet(chunks, path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    floats = ("long", "lat", "relevance")
+    schema = pa.schema(
+        [(col, pa.float64() if col in floats else pa.string()) for col in COLUMNS]
+    )
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema, preserve_index=False))
+            count += chunk.shape[0]
+    return count
+
+
+def parse_since(value: str) -> datetime:
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mongodb_to_csv")
+    parser.add_argument("output", help="Output csv (or .parquet) path")
+    parser.add_argument("-f", "--format", choices=["csv", "parquet"])
+    parser.add_argument(
+        "--continent", default="EUROPE", help="Continent to export, ALL for every one"
+    )
+    parser.add_argument("--country", nargs="+", help="ISO alpha-2 codes to export")
+    parser.add_argument(
+        "--since",
+        type=parse_since,
+        help="Only documents geocoded since this date (ISO format, UTC by default)",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="Cursor batch size")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="Rows per write")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or (
+        "parquet" if args.output.endswith(".parquet") else "csv"
+    )
+    if output_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("Parquet output needs pyarrow (pip install pyarrow)")
+    query = build_filter(
+        None if args.continent.upper() == "ALL" else args.continent.upper(),
+        [country.upper() for country in args.country or []],
+        args.since,
+    )
+
+    client = MongoClient(MONGO_CLIENT)
+    try:
+        collection = client[MONGO_DB_NAME][MONGO_COLLEC_NAME]
+        chunks = iter_chunks(collection, query, args.batch_size, args.chunk_rows)
+        if output_format == "parquet":
+            count = write_parquet(chunks, args.output)
+        else:
+            count = write_csv(chunks, args.output)
+    finally:
+        client.close()
+    print(f"{count} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()